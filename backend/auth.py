@@ -1,5 +1,7 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, List, Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
@@ -8,7 +10,10 @@ import os
 import logging
 
 from models import TokenData, UserResponse
-from database import get_database, USERS_COLLECTION, serialize_doc
+from database import get_database
+from repositories import UsersRepository
+from entitlement import is_entitled
+from tracing import span
 
 logger = logging.getLogger(__name__)
 
@@ -23,11 +28,61 @@ ACCESS_TOKEN_EXPIRE_HOURS = int(os.getenv("JWT_EXPIRE_HOURS", "24"))
 
 def verify_password(plain_password, hashed_password):
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    with span("bcrypt.verify"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     """Hash a password"""
-    return pwd_context.hash(password)
+    with span("bcrypt.hash"):
+        return pwd_context.hash(password)
+
+# Process pool for bulk bcrypt hashing, created on first use
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+_password_executor: Optional[ProcessPoolExecutor] = None
+# Hashing batches submitted to the pool and not yet finished
+_password_batches_queued = 0
+
+def hash_password_batch(passwords: List[str]) -> List[str]:
+    """Hash a chunk of passwords (runs inside a pool worker)"""
+    return [pwd_context.hash(password) for password in passwords]
+
+def get_password_executor() -> ProcessPoolExecutor:
+    global _password_executor
+    if _password_executor is None:
+        _password_executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+    return _password_executor
+
+def shutdown_password_executor():
+    """Stop the hashing pool (called on shutdown)"""
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=False, cancel_futures=True)
+        _password_executor = None
+
+def password_executor_stats() -> Dict:
+    return {"workers": PASSWORD_HASH_WORKERS, "queued": _password_batches_queued}
+
+def _password_batch_done(future):
+    global _password_batches_queued
+    _password_batches_queued -= 1
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    """Hash many passwords in parallel across the process pool, preserving order"""
+    if not passwords:
+        return []
+    loop = asyncio.get_running_loop()
+    executor = get_password_executor()
+    # A few chunks per worker keeps every process busy without per-item IPC
+    chunk_size = max(1, -(-len(passwords) // (PASSWORD_HASH_WORKERS * 4)))
+    chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+    global _password_batches_queued
+    futures = [loop.run_in_executor(executor, hash_password_batch, chunk) for chunk in chunks]
+    _password_batches_queued += len(futures)
+    for future in futures:
+        future.add_done_callback(_password_batch_done)
+    with span("bcrypt.hash_batch", attributes={"passwords": len(passwords), "batches": len(futures)}):
+        results = await asyncio.gather(*futures)
+    return [hashed for chunk in results for hashed in chunk]
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
@@ -42,10 +97,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 async def get_user_by_username(username: str):
-    """Get user by username from database"""
+    """Get user by username from database, including the password hash"""
     db = await get_database()
-    user = await db[USERS_COLLECTION].find_one({"username": username})
-    return serialize_doc(user) if user else None
+    return await UsersRepository(db).get_credentials(username)
 
 async def authenticate_user(username: str, password: str):
     """Authenticate user with username and password"""
@@ -74,10 +128,19 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         logger.error(f"JWT Error: {e}")
         raise credentials_exception
     
-    user = await get_user_by_username(token_data.username)
+    # The principal projection leaves out the password hash
+    db = await get_database()
+    user = await UsersRepository(db).get_principal(token_data.username)
     if user is None:
         raise credentials_exception
-        
-    # Remove password from response
-    user.pop("password", None)
-    return UserResponse(**user)
\ No newline at end of file
+    
+    return UserResponse(**user)
+
+async def get_entitled_user(current_user: UserResponse = Depends(get_current_user)):
+    """Current user, if their subscription grants access; reads the entitlement on the user document"""
+    if not is_entitled(current_user.entitlement):
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail="An active subscription is required"
+        )
+    return current_user
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import logging
+
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+class StaleWhileRevalidateCache:
+    """In-process async cache.
+
+    Values younger than ``ttl`` are served as-is. Values older than ``ttl``
+    but younger than ``ttl + stale_ttl`` are served immediately while a single
+    background task refreshes them. Anything older is loaded inline, with
+    concurrent callers sharing one load.
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0.0, max_entries: int = 1024):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, loading or revalidating it as needed"""
+        with span("cache.get", attributes={"cache.name": self.name}) as cache_span:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+
+            if entry is not None:
+                age = now - entry[0]
+                if age < self.ttl:
+                    self.hits += 1
+                    cache_span.set("cache.result", "hit")
+                    return entry[1]
+                if age < self.ttl + self.stale_ttl:
+                    self.stale_hits += 1
+                    cache_span.set("cache.result", "stale")
+                    if key not in self._inflight:
+                        self._start_load(key, loader).add_done_callback(self._log_refresh_error)
+                    return entry[1]
+
+            self.misses += 1
+            cache_span.set("cache.result", "miss")
+            future = self._inflight.get(key) or self._start_load(key, loader)
+            return await asyncio.shield(future)
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value without loading, regardless of age"""
+        entry = self._entries.get(key)
+        return entry[1] if entry else None
+
+    def set(self, key: Hashable, value: Any):
+        if key not in self._entries and len(self._entries) >= self.max_entries:
+            # Evict the oldest entry
+            oldest = min(self._entries, key=lambda k: self._entries[k][0])
+            del self._entries[oldest]
+        self._entries[key] = (time.monotonic(), value)
+
+    def invalidate(self, key: Hashable = None):
+        """Drop one key, or everything when key is None"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.stale_hits + self.misses
+        return (self.hits + self.stale_hits) / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "staleHits": self.stale_hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hit_ratio, 4)
+        }
+
+    def _start_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        async def load():
+            try:
+                value = await loader()
+                self.set(key, value)
+                return value
+            finally:
+                self._inflight.pop(key, None)
+
+        task = asyncio.ensure_future(load())
+        self._inflight[key] = task
+        return task
+
+    def _log_refresh_error(self, task: asyncio.Future):
+        if not task.cancelled() and task.exception():
+            logger.error(f"Background refresh of cache {self.name} failed: {task.exception()}")
+
+# Registry so metrics can report every cache
+CACHES: Dict[str, StaleWhileRevalidateCache] = {}
+
+def create_cache(name: str, ttl: float, stale_ttl: float = 0.0, max_entries: int = 1024) -> StaleWhileRevalidateCache:
+    """Create and register a named cache"""
+    cache = StaleWhileRevalidateCache(name, ttl, stale_ttl, max_entries)
+    CACHES[name] = cache
+    return cache
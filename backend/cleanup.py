@@ -0,0 +1,193 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import os
+from bson import ObjectId
+from pymongo import ReturnDocument
+import logging
+
+from database import (
+    get_database, USERS_COLLECTION, EXAM_RESULTS_COLLECTION, EXAM_SESSIONS_COLLECTION,
+    SUBSCRIPTIONS_COLLECTION, PAYMENTS_COLLECTION, CLEANUP_JOBS_COLLECTION
+)
+
+logger = logging.getLogger(__name__)
+
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "500"))
+CLEANUP_LEASE = timedelta(minutes=5)
+
+# Collections holding per-user documents and how they store the user id
+CASCADE_TARGETS = [
+    (EXAM_SESSIONS_COLLECTION, "objectId"),
+    (EXAM_RESULTS_COLLECTION, "objectId"),
+    (PAYMENTS_COLLECTION, "string"),
+    (SUBSCRIPTIONS_COLLECTION, "string"),
+]
+
+# Keep references so running jobs are not garbage collected
+_running_tasks = set()
+
+def _user_filter(user_id: str, id_type: str) -> Optional[Dict]:
+    if id_type == "objectId":
+        if not ObjectId.is_valid(user_id):
+            return None
+        return {"userId": ObjectId(user_id)}
+    return {"userId": user_id}
+
+async def create_cleanup_job(db, user_id: str, reason: str = "user_deleted") -> ObjectId:
+    """Persist a cascade job for a deleted user"""
+    now = datetime.utcnow()
+    result = await db[CLEANUP_JOBS_COLLECTION].insert_one({
+        "userId": user_id,
+        "reason": reason,
+        "status": "pending",
+        "completedCollections": [],
+        "deleted": {},
+        "leaseExpiresAt": None,
+        "createdAt": now,
+        "updatedAt": now
+    })
+    return result.inserted_id
+
+async def _claim_job(db, job_id: ObjectId) -> Optional[Dict]:
+    """Take the job lease so only one worker processes it at a time"""
+    now = datetime.utcnow()
+    return await db[CLEANUP_JOBS_COLLECTION].find_one_and_update(
+        {
+            "_id": job_id,
+            "$or": [
+                {"status": "pending"},
+                {"status": "running", "leaseExpiresAt": {"$lt": now}}
+            ]
+        },
+        {"$set": {"status": "running", "leaseExpiresAt": now + CLEANUP_LEASE, "updatedAt": now}},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def run_cleanup_job(job_id: ObjectId, batch_size: int = CLEANUP_BATCH_SIZE) -> bool:
+    """Delete a user's documents collection by collection, in batches.
+
+    Progress is recorded after every batch, so an interrupted job resumes
+    where it stopped; deletes are idempotent, so re-running a batch is safe.
+    """
+    db = await get_database()
+    job = await _claim_job(db, job_id)
+    if not job:
+        return False
+
+    user_id = job["userId"]
+    try:
+        for collection, id_type in CASCADE_TARGETS:
+            if collection in job["completedCollections"]:
+                continue
+
+            query = _user_filter(user_id, id_type)
+            while query is not None:
+                batch = await db[collection].find(query, {"_id": 1}).limit(batch_size).to_list(length=batch_size)
+                if not batch:
+                    break
+                result = await db[collection].delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+                await db[CLEANUP_JOBS_COLLECTION].update_one(
+                    {"_id": job_id},
+                    {
+                        "$inc": {f"deleted.{collection}": result.deleted_count},
+                        "$set": {
+                            "leaseExpiresAt": datetime.utcnow() + CLEANUP_LEASE,
+                            "updatedAt": datetime.utcnow()
+                        }
+                    }
+                )
+
+            await db[CLEANUP_JOBS_COLLECTION].update_one(
+                {"_id": job_id},
+                {"$addToSet": {"completedCollections": collection}}
+            )
+
+        await db[CLEANUP_JOBS_COLLECTION].update_one(
+            {"_id": job_id},
+            {"$set": {"status": "completed", "leaseExpiresAt": None, "updatedAt": datetime.utcnow()}}
+        )
+        logger.info(f"Cleanup job {job_id} completed for user {user_id}")
+        return True
+
+    except Exception as e:
+        # Leave the job pending so it is retried on the next resume
+        logger.error(f"Cleanup job {job_id} failed for user {user_id}: {e}")
+        await db[CLEANUP_JOBS_COLLECTION].update_one(
+            {"_id": job_id},
+            {"$set": {"status": "pending", "error": str(e), "leaseExpiresAt": None, "updatedAt": datetime.utcnow()}}
+        )
+        return False
+
+def schedule_cleanup_job(job_id: ObjectId):
+    """Run a cleanup job in the background"""
+    task = asyncio.create_task(run_cleanup_job(job_id))
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+
+async def resume_cleanup_jobs():
+    """Schedule every unfinished job (called on startup)"""
+    db = await get_database()
+    now = datetime.utcnow()
+    cursor = db[CLEANUP_JOBS_COLLECTION].find(
+        {"$or": [
+            {"status": "pending"},
+            {"status": "running", "leaseExpiresAt": {"$lt": now}}
+        ]},
+        {"_id": 1}
+    )
+    resumed = 0
+    async for job in cursor:
+        schedule_cleanup_job(job["_id"])
+        resumed += 1
+    if resumed:
+        logger.info(f"Resumed {resumed} cleanup jobs")
+
+async def find_orphaned_user_ids(db) -> List[str]:
+    """User ids referenced by per-user collections that no longer exist in users"""
+    orphaned = set()
+    for collection, id_type in CASCADE_TARGETS:
+        if id_type == "objectId":
+            user_ref = "$_id"
+        else:
+            user_ref = {"$convert": {"input": "$_id", "to": "objectId", "onError": None, "onNull": None}}
+
+        pipeline = [
+            {"$group": {"_id": "$userId"}},
+            {"$lookup": {
+                "from": USERS_COLLECTION,
+                "let": {"ref": user_ref},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$_id", "$$ref"]}}},
+                    {"$project": {"_id": 1}}
+                ],
+                "as": "user"
+            }},
+            {"$match": {"user": {"$size": 0}}},
+            {"$project": {"_id": 1}}
+        ]
+        async for group in db[collection].aggregate(pipeline, allowDiskUse=True):
+            if group["_id"] is not None:
+                orphaned.add(str(group["_id"]))
+
+    return sorted(orphaned)
+
+async def sweep_orphans() -> Dict:
+    """Create and schedule cleanup jobs for every orphaned user id"""
+    db = await get_database()
+    orphaned = await find_orphaned_user_ids(db)
+
+    # Skip ids that already have an unfinished job
+    existing = set(await db[CLEANUP_JOBS_COLLECTION].distinct(
+        "userId", {"userId": {"$in": orphaned}, "status": {"$ne": "completed"}}
+    ))
+    created = 0
+    for user_id in orphaned:
+        if user_id in existing:
+            continue
+        job_id = await create_cleanup_job(db, user_id, reason="orphan_sweep")
+        schedule_cleanup_job(job_id)
+        created += 1
+
+    logger.info(f"Orphan sweep found {len(orphaned)} orphaned users, scheduled {created} jobs")
+    return {"orphanedUsers": len(orphaned), "jobsScheduled": created}
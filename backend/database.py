@@ -1,14 +1,85 @@
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
 import os
+import time
 from datetime import datetime
 import logging
 
+from db_monitoring import pool_metrics, command_metrics
+from tracing import command_tracer
+
 logger = logging.getLogger(__name__)
 
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes")
+
+class MongoSettings(BaseModel):
+    """MongoDB client settings.
+
+    Every uvicorn worker owns its own pool, so the server sees up to
+    workers * max_pool_size connections.
+    """
+    url: str
+    db_name: str
+    app_name: str = "arborist-backend"
+    max_pool_size: int = 100
+    min_pool_size: int = 0
+    max_idle_time_ms: Optional[int] = None
+    wait_queue_timeout_ms: Optional[int] = None
+    server_selection_timeout_ms: int = 30000
+    connect_timeout_ms: int = 20000
+    socket_timeout_ms: Optional[int] = None
+    compressors: List[str] = []
+    retry_reads: bool = True
+    retry_writes: bool = True
+
+    @classmethod
+    def from_env(cls) -> "MongoSettings":
+        optional_int = lambda name: int(os.environ[name]) if os.getenv(name) else None
+        return cls(
+            url=os.environ['MONGO_URL'],
+            db_name=os.environ['DB_NAME'],
+            app_name=os.getenv("MONGO_APP_NAME", "arborist-backend"),
+            max_pool_size=int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+            min_pool_size=int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+            max_idle_time_ms=optional_int("MONGO_MAX_IDLE_TIME_MS"),
+            wait_queue_timeout_ms=optional_int("MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+            server_selection_timeout_ms=int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000")),
+            connect_timeout_ms=int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "20000")),
+            socket_timeout_ms=optional_int("MONGO_SOCKET_TIMEOUT_MS"),
+            # e.g. "zstd,zlib"; zstd and snappy need their optional packages installed
+            compressors=[c.strip() for c in os.getenv("MONGO_COMPRESSORS", "").split(",") if c.strip()],
+            retry_reads=_env_bool("MONGO_RETRY_READS", "true"),
+            retry_writes=_env_bool("MONGO_RETRY_WRITES", "true")
+        )
+
+    def client_options(self) -> Dict:
+        options = {
+            "appname": self.app_name,
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "maxIdleTimeMS": self.max_idle_time_ms,
+            "waitQueueTimeoutMS": self.wait_queue_timeout_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "socketTimeoutMS": self.socket_timeout_ms,
+            "retryReads": self.retry_reads,
+            "retryWrites": self.retry_writes
+        }
+        if self.compressors:
+            options["compressors"] = ",".join(self.compressors)
+        return options
+
 class Database:
     client: Optional[AsyncIOMotorClient] = None
     database: Optional[AsyncIOMotorDatabase] = None
+    settings: Optional[MongoSettings] = None
+    # Replica set or sharded cluster: transactions, secondary reads and causal sessions
+    replicated: bool = False
+    read_databases: Dict[str, AsyncIOMotorDatabase] = {}
 
 database = Database()
 
@@ -18,12 +89,21 @@ async def get_database() -> AsyncIOMotorDatabase:
 async def connect_to_mongo():
     """Create database connection"""
     logger.info("Connecting to MongoDB...")
-    database.client = AsyncIOMotorClient(os.environ['MONGO_URL'])
-    database.database = database.client[os.environ['DB_NAME']]
+    settings = MongoSettings.from_env()
+    database.settings = settings
+    database.client = AsyncIOMotorClient(
+        settings.url,
+        event_listeners=[pool_metrics, command_metrics, command_tracer],
+        **settings.client_options()
+    )
+    database.database = database.client[settings.db_name]
     
     # Test the connection
     try:
         await database.client.admin.command('ping')
+        hello = await database.client.admin.command('hello')
+        database.replicated = "setName" in hello or hello.get("msg") == "isdbgrid"
+        database.read_databases = {}
         logger.info("Successfully connected to MongoDB!")
     except Exception as e:
         logger.error(f"Failed to connect to MongoDB: {e}")
@@ -35,6 +115,101 @@ async def close_mongo_connection():
     if database.client:
         database.client.close()
 
+@asynccontextmanager
+async def transaction():
+    """Yield a session inside a transaction, or None on a standalone server"""
+    if not database.replicated:
+        yield None
+        return
+    async with await database.client.start_session() as session:
+        async with session.start_transaction():
+            yield session
+
+READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest
+}
+
+# Read-only routes that may be served by secondaries. Override per route with
+# MONGO_READ_ROUTES, e.g. "admin_stats=secondary,questions=primary"
+READ_ROUTES = {
+    "questions": "secondaryPreferred",
+    "exam_history": "secondaryPreferred",
+    "admin_stats": "secondaryPreferred"
+}
+for _entry in filter(None, os.getenv("MONGO_READ_ROUTES", "").split(",")):
+    _route, _, _mode = _entry.partition("=")
+    READ_ROUTES[_route.strip()] = _mode.strip()
+
+# Secondaries lagging more than this are not read from (MongoDB minimum: 90)
+MAX_STALENESS_SECONDS = int(os.getenv("MONGO_MAX_STALENESS_SECONDS", "90"))
+# How long after a user's write their reads carry its causal timestamps
+READ_YOUR_WRITES_SECONDS = float(os.getenv("MONGO_READ_YOUR_WRITES_SECONDS", "300"))
+CAUSAL_TIMES_MAX_ENTRIES = 10000
+
+def _read_preference(mode: str):
+    preference = READ_PREFERENCE_MODES.get(mode, Primary)
+    if preference is Primary:
+        return Primary()
+    return preference(max_staleness=MAX_STALENESS_SECONDS)
+
+async def get_read_database(route: str) -> AsyncIOMotorDatabase:
+    """Database handle with the read preference configured for a read-only route"""
+    if not database.replicated:
+        return database.database
+    read_db = database.read_databases.get(route)
+    if read_db is None:
+        read_db = database.database.with_options(
+            read_preference=_read_preference(READ_ROUTES.get(route, "primary"))
+        )
+        database.read_databases[route] = read_db
+    return read_db
+
+# key (user id) -> (cluster time, operation time, recorded at) of the key's last write
+_causal_times: Dict[str, Tuple[Dict, object, float]] = {}
+
+@asynccontextmanager
+async def causal_write_session(key: str):
+    """Session for writes whose effects ``key`` must be able to read back from a secondary"""
+    if not database.replicated:
+        yield None
+        return
+    async with await database.client.start_session(causal_consistency=True) as session:
+        yield session
+        if len(_causal_times) >= CAUSAL_TIMES_MAX_ENTRIES:
+            cutoff = time.monotonic() - READ_YOUR_WRITES_SECONDS
+            for stale_key in [k for k, v in _causal_times.items() if v[2] < cutoff]:
+                del _causal_times[stale_key]
+        _causal_times[key] = (session.cluster_time, session.operation_time, time.monotonic())
+
+@asynccontextmanager
+async def causal_read_session(key: str):
+    """Session whose reads observe ``key``'s recent writes (afterClusterTime), or None"""
+    recorded = _causal_times.get(key) if database.replicated else None
+    if recorded is None or time.monotonic() - recorded[2] > READ_YOUR_WRITES_SECONDS:
+        yield None
+        return
+    cluster_time, operation_time, _ = recorded
+    async with await database.client.start_session(causal_consistency=True) as session:
+        if cluster_time:
+            session.advance_cluster_time(cluster_time)
+        if operation_time:
+            session.advance_operation_time(operation_time)
+        yield session
+
+def pool_stats() -> Dict:
+    """Connection pool metrics for this worker, with the configured limits"""
+    settings = database.settings
+    return {
+        "maxPoolSize": settings.max_pool_size if settings else None,
+        "minPoolSize": settings.min_pool_size if settings else None,
+        "waitQueueTimeoutMS": settings.wait_queue_timeout_ms if settings else None,
+        **pool_metrics.stats()
+    }
+
 # Collection names
 USERS_COLLECTION = "users"
 QUESTIONS_COLLECTION = "questions"
@@ -42,6 +217,10 @@ EXAM_RESULTS_COLLECTION = "exam_results"
 EXAM_SESSIONS_COLLECTION = "exam_sessions"
 SUBSCRIPTIONS_COLLECTION = "subscriptions"
 PAYMENTS_COLLECTION = "payments"
+MIGRATIONS_COLLECTION = "schema_migrations"
+CLEANUP_JOBS_COLLECTION = "cleanup_jobs"
+PAYPAL_EVENTS_COLLECTION = "paypal_events"
+REVENUE_ROLLUPS_COLLECTION = "revenue_rollups"
 
 # Utility functions for database operations
 def serialize_doc(doc):
@@ -54,27 +233,3 @@ def serialize_doc(doc):
 def serialize_docs(docs):
     """Convert list of MongoDB documents to list of dicts with string IDs"""
     return [serialize_doc(doc) for doc in docs]
-
-async def create_indexes():
-    """Create database indexes for better performance"""
-    db = await get_database()
-    
-    # Users collection indexes
-    await db[USERS_COLLECTION].create_index("username", unique=True)
-    await db[USERS_COLLECTION].create_index("email", unique=True)
-    
-    # Questions collection indexes  
-    await db[QUESTIONS_COLLECTION].create_index("topicId")
-    await db[QUESTIONS_COLLECTION].create_index("type")
-    await db[QUESTIONS_COLLECTION].create_index("difficulty")
-    
-    # Exam results collection indexes
-    await db[EXAM_RESULTS_COLLECTION].create_index("userId")
-    await db[EXAM_RESULTS_COLLECTION].create_index("examType")
-    await db[EXAM_RESULTS_COLLECTION].create_index("completedAt")
-    
-    # Exam sessions collection indexes
-    await db[EXAM_SESSIONS_COLLECTION].create_index("userId")
-    await db[EXAM_SESSIONS_COLLECTION].create_index("startTime")
-    
-    logger.info("Database indexes created successfully")
\ No newline at end of file
@@ -0,0 +1,410 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+import os
+from pymongo import monitoring
+import logging
+
+from log_pipeline import request_id
+
+logger = logging.getLogger(__name__)
+
+# Recent checkout waits kept for percentiles
+WAIT_SAMPLE_SIZE = 1000
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
+
+# Per-request round-trip budgets: off, warn (log) or enforce (fail the request; for tests)
+DB_BUDGET_MODE = os.getenv("DB_BUDGET_MODE", "warn").lower()
+# The same query shape repeated this often in one request is reported as a likely N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+# Handshake, auth and session housekeeping are not application queries
+IGNORED_COMMANDS = {
+    "hello", "ismaster", "isMaster", "ping", "buildinfo", "buildInfo",
+    "saslStart", "saslContinue", "authenticate", "getnonce", "endSessions", "killCursors"
+}
+
+# ASGI scope of the request being served; Motor copies the context into its executor threads
+request_scope: ContextVar[Optional[Dict]] = ContextVar("request_scope", default=None)
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool counters: checked-out connections, checkout wait time and churn.
+
+    PyMongo publishes pool events on the thread running the operation, so the
+    checkout start time is kept thread-locally and all counters sit behind a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = {}
+            self.waits_ms = deque(maxlen=WAIT_SAMPLE_SIZE)
+            self.max_wait_ms = 0.0
+            self.connections_open = 0
+            self.connections_created = 0
+            self.connections_closed = {}
+            self.pools_cleared = 0
+
+    # Checkout lifecycle
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait_ms = self._wait_ms()
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.waits_ms.append(wait_ms)
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_check_out_failed(self, event):
+        wait_ms = self._wait_ms()
+        with self._lock:
+            self.checkout_failures[event.reason] = self.checkout_failures.get(event.reason, 0) + 1
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def _wait_ms(self) -> float:
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return (time.perf_counter() - started) * 1000 if started else 0.0
+
+    # Connection churn
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+            self.connections_open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed[event.reason] = self.connections_closed.get(event.reason, 0) + 1
+            self.connections_open = max(self.connections_open - 1, 0)
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_cleared += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            waits = list(self.waits_ms)
+            return {
+                "checkedOut": self.checked_out,
+                "maxCheckedOut": self.max_checked_out,
+                "open": self.connections_open,
+                "checkouts": self.checkouts,
+                "checkoutFailures": dict(self.checkout_failures),
+                "waitMs": {
+                    "avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                    "p95": round(_percentile(waits, 95), 3),
+                    "max": round(self.max_wait_ms, 3)
+                },
+                "churn": {
+                    "created": self.connections_created,
+                    "closed": dict(self.connections_closed),
+                    "poolsCleared": self.pools_cleared
+                }
+            }
+
+pool_metrics = PoolMetrics()
+
+# Task serving each in-flight request, for code that cannot see the task's context
+_request_tasks: Dict[asyncio.Task, Dict] = {}
+
+def route_label(scope: Dict) -> str:
+    """Route template of a request, e.g. GET /api/questions/{question_id}"""
+    route = scope.get("route")
+    return f"{scope.get('method')} {getattr(route, 'path', scope.get('path'))}"
+
+def current_route() -> str:
+    scope = request_scope.get()
+    return route_label(scope) if scope is not None else "background"
+
+def route_for_task(task: Optional[asyncio.Task]) -> str:
+    """Route served by a task; safe to call from another thread"""
+    scope = _request_tasks.get(task) if task is not None else None
+    return route_label(scope) if scope is not None else "background"
+
+class DbBudgetExceeded(AssertionError):
+    """A route made more database round trips than its declared budget"""
+
+def db_budget(round_trips: int) -> Callable:
+    """Declare the most database round trips an endpoint may make per request.
+
+    Place it under the router decorator. Over-budget requests are logged, or
+    fail with DbBudgetExceeded when DB_BUDGET_MODE=enforce.
+    """
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.db_budget = round_trips
+        return endpoint
+    return decorator
+
+class RequestDbStats:
+    """Database round trips and time spent on them while serving one request.
+
+    Shared by reference through a ContextVar, so Motor's executor threads
+    update the same object; counters sit behind a lock because a request can
+    run several operations concurrently.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.round_trips = 0
+        self.db_ms = 0.0
+        self.shapes: Dict[tuple, int] = {}
+
+    def record_shape(self, shape: tuple):
+        with self._lock:
+            self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def record(self, duration_ms: float):
+        with self._lock:
+            self.round_trips += 1
+            self.db_ms += duration_ms
+
+    def repeated_shapes(self, threshold: int):
+        with self._lock:
+            return [(shape, count) for shape, count in self.shapes.items() if count >= threshold]
+
+request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("request_db_stats", default=None)
+
+def _query_shape(command_name: str, collection: Optional[str], query: Any) -> tuple:
+    fields = tuple(sorted(query)) if isinstance(query, dict) else ()
+    return (command_name, collection, fields)
+
+def server_timing(stats: RequestDbStats, app_ms: float) -> str:
+    return (
+        f'db;dur={stats.db_ms:.1f};desc="round trips: {stats.round_trips}", '
+        f"app;dur={app_ms:.1f}"
+    )
+
+def check_db_budget(scope: Dict, stats: RequestDbStats):
+    """Compare a finished request against its endpoint's declared budget"""
+    if DB_BUDGET_MODE == "off":
+        return
+    budget = getattr(getattr(scope.get("route"), "endpoint", None), "db_budget", None)
+    if budget is None or stats.round_trips <= budget:
+        return
+    message = f"{current_route()} made {stats.round_trips} database round trips (budget {budget})"
+    if DB_BUDGET_MODE == "enforce":
+        raise DbBudgetExceeded(message)
+    logger.warning(message)
+
+def report_n_plus_one(stats: RequestDbStats):
+    for (command_name, collection, fields), count in stats.repeated_shapes(N_PLUS_ONE_THRESHOLD):
+        logger.warning(
+            f"Possible N+1 in {current_route()}: {count}x {command_name} {collection} "
+            f"on {list(fields)}"
+        )
+
+def _incoming_request_id(scope: Dict) -> Optional[str]:
+    """A caller-supplied X-Request-ID, if it is short and printable"""
+    for name, value in scope.get("headers", []):
+        if name == b"x-request-id":
+            value = value.decode("latin-1")
+            return value if 0 < len(value) <= 128 and value.isprintable() else None
+    return None
+
+class RequestContextMiddleware:
+    """Expose the ASGI scope and a request id to code running for the request and meter its database use.
+
+    Round trips and DB time are reported in a Server-Timing header and checked
+    against the endpoint's db_budget when the response starts; work done after
+    that (streaming bodies, background refreshes) only feeds the N+1 report.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        stats = RequestDbStats()
+        scope_token = request_scope.set(scope)
+        stats_token = request_db_stats.set(stats)
+        id_token = request_id.set(_incoming_request_id(scope) or uuid.uuid4().hex)
+        task = asyncio.current_task()
+        _request_tasks[task] = scope
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                check_db_budget(scope, stats)
+                timing = server_timing(stats, (time.perf_counter() - started) * 1000)
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (b"server-timing", timing.encode("latin-1")),
+                        (b"x-request-id", request_id.get().encode("latin-1"))
+                    ]
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_tasks.pop(task, None)
+            report_n_plus_one(stats)
+            request_id.reset(id_token)
+            request_db_stats.reset(stats_token)
+            request_scope.reset(scope_token)
+
+def redact(value: Any) -> Any:
+    """Keep the shape of a filter (fields, operators, $field paths) and replace values with ?"""
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if any(isinstance(item, (dict, list, tuple)) for item in value):
+            return [redact(item) for item in value]
+        return "?"
+    if isinstance(value, str) and value.startswith("$"):
+        return value
+    return "?"
+
+def _command_filter(command_name: str, command: Dict) -> Any:
+    if command_name == "find":
+        return command.get("filter", {})
+    if command_name in ("count", "distinct", "findAndModify"):
+        return command.get("query", {})
+    if command_name == "aggregate":
+        return command.get("pipeline", [])
+    if command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes") or [{}]
+        return statements[0].get("q", {})
+    return None
+
+class CommandMetrics(monitoring.CommandListener):
+    """Per-command latency by route, collection and operation, plus a slow-query log"""
+
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS, log_size: int = SLOW_QUERY_LOG_SIZE):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._pending: Dict[tuple, Dict] = {}
+        self.slow_queries = deque(maxlen=log_size)
+        self.operations: Dict[tuple, Dict] = {}
+
+    def reset(self):
+        with self._lock:
+            self.slow_queries.clear()
+            self.operations.clear()
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        collection = collection if isinstance(collection, str) else None
+        query = _command_filter(event.command_name, event.command)
+        request_stats = request_db_stats.get()
+        if request_stats is not None and event.command_name != "getMore":
+            request_stats.record_shape(_query_shape(event.command_name, collection, query))
+        self._pending[(event.connection_id, event.request_id)] = {
+            "command": event.command_name,
+            "collection": collection,
+            "route": current_route(),
+            "filter": query,
+            "request": request_stats
+        }
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        info = self._pending.pop((event.connection_id, event.request_id), None)
+        if info is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        key = (info["route"], info["collection"], info["command"])
+        if info["request"] is not None:
+            info["request"].record(duration_ms)
+
+        with self._lock:
+            op = self.operations.get(key)
+            if op is None:
+                op = self.operations[key] = {"count": 0, "failures": 0, "totalMs": 0.0, "maxMs": 0.0}
+            op["count"] += 1
+            op["totalMs"] += duration_ms
+            op["maxMs"] = max(op["maxMs"], duration_ms)
+            if failed:
+                op["failures"] += 1
+
+        if duration_ms >= self.slow_ms:
+            entry = {
+                "at": time.time(),
+                "durationMs": round(duration_ms, 3),
+                "route": info["route"],
+                "collection": info["collection"],
+                "command": info["command"],
+                "filter": redact(info["filter"]),
+                "failed": failed
+            }
+            with self._lock:
+                self.slow_queries.append(entry)
+            logger.warning(
+                f"Slow query {entry['durationMs']}ms {info['command']} {info['collection']} "
+                f"[{info['route']}] filter={str(entry['filter'])[:500]}"
+            )
+
+    def stats(self, limit: int = 50) -> Dict:
+        with self._lock:
+            operations = [
+                {
+                    "route": route,
+                    "collection": collection,
+                    "command": command,
+                    "count": op["count"],
+                    "failures": op["failures"],
+                    "avgMs": round(op["totalMs"] / op["count"], 3),
+                    "maxMs": round(op["maxMs"], 3),
+                    "totalMs": round(op["totalMs"], 3)
+                }
+                for (route, collection, command), op in self.operations.items()
+            ]
+            slow = sorted(self.slow_queries, key=lambda q: q["durationMs"], reverse=True)
+        operations.sort(key=lambda op: op["totalMs"], reverse=True)
+        return {
+            "slowQueryMs": self.slow_ms,
+            "operations": operations[:limit],
+            "slowest": slow[:limit]
+        }
+
+command_metrics = CommandMetrics()
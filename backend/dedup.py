@@ -0,0 +1,256 @@
+import hashlib
+import os
+import re
+import unicodedata
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+
+from database import QUESTIONS_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+# MinHash / LSH settings. NUM_PERM must equal LSH_BANDS * LSH_ROWS.
+# With 16 bands of 4 rows, pairs above ~0.5 Jaccard become candidates and
+# pairs above 0.7 are caught with >99% probability.
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = 4
+SHINGLE_SIZE = 5
+SIGNATURE_VERSION = 1
+
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_SIMILARITY_THRESHOLD", "0.7"))
+BACKFILL_BATCH_SIZE = 500
+# Buckets larger than this are compared against their first member only
+MAX_PAIRWISE_BUCKET = 50
+
+# Fields stored on question documents; never needed by read paths
+SIGNATURE_FIELDS = ("minhash", "lshBuckets", "minhashVersion")
+SIGNATURE_PROJECTION = {field: 0 for field in SIGNATURE_FIELDS}
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Fixed seed so signatures are stable across processes and restarts
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, (1 << 32) - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, (1 << 32) - 1, size=NUM_PERM, dtype=np.uint64)
+
+def normalize_text(text: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+def question_text(question) -> str:
+    """Extract the bilingual question text used for duplicate detection"""
+    if isinstance(question, dict):
+        parts = [question.get("es", ""), question.get("en", "")]
+    else:
+        parts = [str(question or "")]
+    return " | ".join(normalize_text(part) for part in parts if part)
+
+def shingles(text: str) -> set:
+    """Character shingles of the normalized text"""
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def compute_minhash(text: str) -> List[int]:
+    """Compute the MinHash signature of a text"""
+    items = shingles(text)
+    if not items:
+        return [int(_MAX_HASH)] * NUM_PERM
+
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in items),
+        dtype=np.uint64,
+        count=len(items)
+    )
+    # (a * x + b) mod p for every permutation/shingle pair, then min per permutation
+    with np.errstate(over="ignore"):
+        permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME
+    permuted &= _MAX_HASH
+    return permuted.min(axis=0).tolist()
+
+def lsh_buckets(signature: List[int]) -> List[str]:
+    """Hash each band of the signature into a bucket key"""
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(
+            ",".join(str(v) for v in rows).encode("ascii"), digest_size=8
+        ).hexdigest()
+        buckets.append(f"{band}:{digest}")
+    return buckets
+
+def estimate_similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """Estimate Jaccard similarity from two MinHash signatures"""
+    if not sig_a or not sig_b or len(sig_a) != len(sig_b):
+        return 0.0
+    matches = sum(1 for a, b in zip(sig_a, sig_b) if a == b)
+    return matches / len(sig_a)
+
+def signature_fields(question) -> Dict:
+    """Build the signature fields to store on a question document"""
+    signature = compute_minhash(question_text(question))
+    return {
+        "minhash": signature,
+        "lshBuckets": lsh_buckets(signature),
+        "minhashVersion": SIGNATURE_VERSION
+    }
+
+async def find_near_duplicates(db, fields: Dict, threshold: Optional[float] = None, limit: int = 5) -> List[Dict]:
+    """Find stored questions whose signature is close to the given signature fields"""
+    threshold = DUPLICATE_THRESHOLD if threshold is None else threshold
+
+    candidates = db[QUESTIONS_COLLECTION].find(
+        {"lshBuckets": {"$in": fields["lshBuckets"]}},
+        {"minhash": 1, "question": 1, "topicId": 1}
+    )
+
+    matches = []
+    async for candidate in candidates:
+        similarity = estimate_similarity(fields["minhash"], candidate.get("minhash"))
+        if similarity >= threshold:
+            matches.append({
+                "id": str(candidate["_id"]),
+                "topicId": candidate.get("topicId"),
+                "question": candidate.get("question"),
+                "similarity": round(similarity, 3)
+            })
+
+    matches.sort(key=lambda m: m["similarity"], reverse=True)
+    return matches[:limit]
+
+class BatchDuplicateIndex:
+    """In-memory LSH index used to catch near-duplicates within one import batch"""
+
+    def __init__(self, threshold: Optional[float] = None):
+        self.threshold = DUPLICATE_THRESHOLD if threshold is None else threshold
+        self.buckets: Dict[str, List[int]] = {}
+        self.entries: List[Tuple[str, List[int]]] = []
+
+    def match(self, fields: Dict) -> Optional[Tuple[str, float]]:
+        """Return (label, similarity) of the best match already in the batch"""
+        seen = set()
+        best = None
+        for bucket in fields["lshBuckets"]:
+            for idx in self.buckets.get(bucket, []):
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                label, signature = self.entries[idx]
+                similarity = estimate_similarity(fields["minhash"], signature)
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (label, similarity)
+        return best
+
+    def add(self, label: str, fields: Dict):
+        """Register a question in the batch index"""
+        idx = len(self.entries)
+        self.entries.append((label, fields["minhash"]))
+        for bucket in fields["lshBuckets"]:
+            self.buckets.setdefault(bucket, []).append(idx)
+
+async def backfill_signatures(db, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Compute signatures for questions stored before duplicate detection existed"""
+    updated = 0
+    query = {"minhashVersion": {"$ne": SIGNATURE_VERSION}}
+
+    while True:
+        batch = await db[QUESTIONS_COLLECTION].find(
+            query, {"question": 1}
+        ).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+
+        operations = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": signature_fields(doc.get("question"))})
+            for doc in batch
+        ]
+        await db[QUESTIONS_COLLECTION].bulk_write(operations, ordered=False)
+        updated += len(operations)
+
+    if updated:
+        logger.info(f"Backfilled near-duplicate signatures for {updated} questions")
+    return updated
+
+async def near_duplicate_report(db, threshold: Optional[float] = None, max_clusters: int = 200) -> Dict:
+    """Group the question bank into clusters of near-duplicates using LSH buckets"""
+    threshold = DUPLICATE_THRESHOLD if threshold is None else threshold
+    await backfill_signatures(db)
+
+    # Only buckets shared by more than one question produce candidate pairs
+    pipeline = [
+        {"$project": {"lshBuckets": 1}},
+        {"$unwind": "$lshBuckets"},
+        {"$group": {"_id": "$lshBuckets", "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+        {"$project": {"_id": 0, "ids": 1}}
+    ]
+    candidate_pairs = set()
+    async for bucket in db[QUESTIONS_COLLECTION].aggregate(pipeline, allowDiskUse=True):
+        ids = sorted(bucket["ids"])
+        if len(ids) > MAX_PAIRWISE_BUCKET:
+            candidate_pairs.update((ids[0], other) for other in ids[1:])
+            continue
+        for i in range(len(ids)):
+            for j in range(i + 1, len(ids)):
+                candidate_pairs.add((ids[i], ids[j]))
+
+    if not candidate_pairs:
+        return {"threshold": threshold, "clusters": [], "total": 0}
+
+    candidate_ids = {qid for pair in candidate_pairs for qid in pair}
+    docs = {}
+    cursor = db[QUESTIONS_COLLECTION].find(
+        {"_id": {"$in": list(candidate_ids)}},
+        {"minhash": 1, "question": 1, "topicId": 1}
+    )
+    async for doc in cursor:
+        docs[doc["_id"]] = doc
+
+    # Union-find over confirmed pairs
+    parent = {}
+
+    def find(x):
+        while parent.get(x, x) != x:
+            parent[x] = parent.get(parent[x], parent[x])
+            x = parent[x]
+        return x
+
+    pair_similarity = {}
+    for a, b in candidate_pairs:
+        if a not in docs or b not in docs:
+            continue
+        similarity = estimate_similarity(docs[a].get("minhash"), docs[b].get("minhash"))
+        if similarity >= threshold:
+            pair_similarity[(a, b)] = similarity
+            parent[find(a)] = find(b)
+
+    clusters: Dict = {}
+    for (a, b), similarity in pair_similarity.items():
+        root = find(a)
+        cluster = clusters.setdefault(root, {"ids": set(), "maxSimilarity": 0.0})
+        cluster["ids"].update((a, b))
+        cluster["maxSimilarity"] = max(cluster["maxSimilarity"], similarity)
+
+    report = []
+    for cluster in sorted(clusters.values(), key=lambda c: c["maxSimilarity"], reverse=True)[:max_clusters]:
+        report.append({
+            "maxSimilarity": round(cluster["maxSimilarity"], 3),
+            "questions": [
+                {
+                    "id": str(qid),
+                    "topicId": docs[qid].get("topicId"),
+                    "question": docs[qid].get("question")
+                }
+                for qid in sorted(cluster["ids"])
+            ]
+        })
+
+    return {"threshold": threshold, "clusters": report, "total": len(clusters)}
@@ -0,0 +1,51 @@
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from database import USERS_COLLECTION
+from models import Entitlement, SubscriptionStatus
+from subscription_state import subscription_end_date
+
+ENTITLED_STATUSES = [SubscriptionStatus.trial.value, SubscriptionStatus.active.value]
+
+def entitlement_from_subscription(subscription: Dict) -> Dict:
+    """The entitlement stored on the user document for a subscription"""
+    status = subscription.get("status")
+    return {
+        "status": status.value if isinstance(status, SubscriptionStatus) else status,
+        "expiresAt": subscription_end_date(subscription)
+    }
+
+def is_entitled(entitlement: Optional[Entitlement], now: Optional[datetime] = None) -> bool:
+    """Whether a user's denormalized entitlement grants access right now"""
+    if entitlement is None or entitlement.expiresAt is None:
+        return False
+    return entitlement.status in ENTITLED_STATUSES and entitlement.expiresAt > (now or datetime.utcnow())
+
+async def set_entitlements(db, entitlements: Dict[str, Dict], session=None):
+    """Write entitlements keyed by user id (the string form of users._id)"""
+    operations = [
+        UpdateOne({"_id": ObjectId(user_id)}, {"$set": {"entitlement": entitlement}})
+        for user_id, entitlement in entitlements.items()
+        if ObjectId.is_valid(user_id)
+    ]
+    if operations:
+        await db[USERS_COLLECTION].bulk_write(operations, ordered=False, session=session)
+
+async def expire_entitlements(db, now: datetime, session=None) -> int:
+    """Mirror of the subscription expiry sweep on user documents"""
+    result = await db[USERS_COLLECTION].update_many(
+        {"entitlement.status": {"$in": ENTITLED_STATUSES}, "entitlement.expiresAt": {"$lte": now}},
+        {"$set": {"entitlement.status": SubscriptionStatus.expired.value}},
+        session=session
+    )
+    return result.modified_count
+
+async def backfill_entitlements(db, subscriptions: Iterable[Dict]):
+    """Derive entitlements for one batch of subscription documents"""
+    await set_entitlements(db, {
+        subscription["userId"]: entitlement_from_subscription(subscription)
+        for subscription in subscriptions
+        if subscription.get("userId")
+    })
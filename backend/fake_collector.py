@@ -0,0 +1,117 @@
+"""
+Local stand-in for an OpenTelemetry collector, for looking at traces during
+development and load tests.
+
+Accepts OTLP/HTTP JSON on POST /v1/traces (what tracing.py sends) and keeps
+the most recent traces in memory. Point the backend at it with:
+
+    TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces
+
+Run with ``python fake_collector.py``. GET /traces lists recent traces,
+slowest first, optionally filtered by root span name (e.g.
+``?name=POST /api/exams/submit``); GET /traces/{trace_id} renders the span
+tree with durations and offsets. FAKE_COLLECTOR_FILE also appends every
+received batch to a JSON-lines file.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import json
+import os
+import logging
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+logger = logging.getLogger(__name__)
+
+MAX_TRACES = int(os.getenv("FAKE_COLLECTOR_MAX_TRACES", "1000"))
+EXPORT_FILE = os.getenv("FAKE_COLLECTOR_FILE")
+
+app = FastAPI(title="Fake OTLP collector")
+
+# trace id -> spans, oldest trace first
+traces: "OrderedDict[str, List[Dict]]" = OrderedDict()
+
+def _attributes(attributes: List[Dict]) -> Dict:
+    return {item["key"]: next(iter(item["value"].values()), None) for item in attributes or []}
+
+def _duration_ms(item: Dict) -> float:
+    return (int(item["endTimeUnixNano"]) - int(item["startTimeUnixNano"])) / 1e6
+
+def _root(spans: List[Dict]) -> Dict:
+    ids = {item["spanId"] for item in spans}
+    roots = [item for item in spans if item.get("parentSpanId") not in ids]
+    return min(roots or spans, key=lambda item: int(item["startTimeUnixNano"]))
+
+@app.post("/v1/traces")
+async def receive_traces(request: Request):
+    payload = await request.json()
+    received = 0
+    for resource_spans in payload.get("resourceSpans", []):
+        service = _attributes(resource_spans.get("resource", {}).get("attributes")).get("service.name")
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for item in scope_spans.get("spans", []):
+                item["service"] = service
+                traces.setdefault(item["traceId"], []).append(item)
+                traces.move_to_end(item["traceId"])
+                received += 1
+    while len(traces) > MAX_TRACES:
+        traces.popitem(last=False)
+    if EXPORT_FILE:
+        with open(EXPORT_FILE, "a") as f:
+            f.write(json.dumps(payload) + "\n")
+    logger.info(f"Received {received} spans")
+    return {}
+
+@app.get("/traces")
+async def list_traces(name: Optional[str] = None, limit: int = 50):
+    summaries = []
+    for trace_id, spans in traces.items():
+        root = _root(spans)
+        if name and root["name"] != name:
+            continue
+        summaries.append({
+            "traceId": trace_id,
+            "root": root["name"],
+            "durationMs": round(_duration_ms(root), 3),
+            "spans": len(spans),
+            "errors": sum(1 for item in spans if item.get("status", {}).get("code") == 2)
+        })
+    summaries.sort(key=lambda summary: summary["durationMs"], reverse=True)
+    return summaries[:limit]
+
+@app.get("/traces/{trace_id}", response_class=PlainTextResponse)
+async def show_trace(trace_id: str):
+    spans = traces.get(trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    children: Dict[Optional[str], List[Dict]] = {}
+    for item in spans:
+        children.setdefault(item.get("parentSpanId"), []).append(item)
+    root = _root(spans)
+    trace_start = int(root["startTimeUnixNano"])
+    lines = []
+
+    def render(item: Dict, depth: int):
+        offset_ms = (int(item["startTimeUnixNano"]) - trace_start) / 1e6
+        attributes = _attributes(item.get("attributes"))
+        detail = attributes.get("db.mongodb.collection") or attributes.get("cache.result") or ""
+        error = f"  ERROR {item['status'].get('message', '')}" if item.get("status", {}).get("code") == 2 else ""
+        lines.append(
+            f"{offset_ms:9.2f}ms {_duration_ms(item):9.2f}ms  {'  ' * depth}{item['name']} {detail}{error}".rstrip()
+        )
+        for child in sorted(children.get(item["spanId"], []), key=lambda c: int(c["startTimeUnixNano"])):
+            render(child, depth + 1)
+
+    render(root, 0)
+    return "   offset   duration  span\n" + "\n".join(lines) + "\n"
+
+@app.delete("/traces")
+async def reset():
+    traces.clear()
+    return {"message": "reset"}
+
+if __name__ == "__main__":
+    import uvicorn
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("FAKE_COLLECTOR_PORT", "4318")))
@@ -0,0 +1,263 @@
+"""
+Local stand-in for the PayPal REST API, for load and integration testing.
+
+Implements the subset of endpoints used by paypal_gateway.py (OAuth token,
+payments create/find/execute, webhook signature verification) and can send
+webhook events to the backend. Point the backend at it with:
+
+    PAYPAL_API_BASE=http://localhost:8099
+
+Run with ``python fake_paypal.py``. Latency and failures are configured with
+FAKE_PAYPAL_* environment variables or at runtime through PUT /fake/config.
+"""
+import asyncio
+import base64
+import random
+import secrets
+import uuid
+from datetime import datetime
+from typing import Dict, Optional
+import os
+import httpx
+import logging
+
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, RedirectResponse
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+class FakeConfig(BaseModel):
+    latency_ms: float = float(os.getenv("FAKE_PAYPAL_LATENCY_MS", "0"))
+    jitter_ms: float = float(os.getenv("FAKE_PAYPAL_JITTER_MS", "0"))
+    # Fraction of API calls answered with a 503
+    failure_rate: float = float(os.getenv("FAKE_PAYPAL_FAILURE_RATE", "0"))
+    # Fraction of API calls that hang for hang_seconds before answering
+    hang_rate: float = float(os.getenv("FAKE_PAYPAL_HANG_RATE", "0"))
+    hang_seconds: float = float(os.getenv("FAKE_PAYPAL_HANG_SECONDS", "30"))
+    token_expires_in: int = int(os.getenv("FAKE_PAYPAL_TOKEN_EXPIRES_IN", "32400"))
+    # Backend webhook endpoint; events are only sent when this is set
+    webhook_url: Optional[str] = os.getenv("FAKE_PAYPAL_WEBHOOK_URL")
+
+config = FakeConfig()
+payments: Dict[str, Dict] = {}
+tokens: Dict[str, float] = {}
+stats = {"requests": 0, "injectedFailures": 0, "injectedHangs": 0, "webhooksSent": 0}
+
+app = FastAPI(title="Fake PayPal REST API")
+
+def _base_url(request: Request) -> str:
+    return str(request.base_url).rstrip("/")
+
+async def _simulate(request: Request):
+    """Apply configured latency and failure injection to an API call"""
+    stats["requests"] += 1
+    delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+    if config.hang_rate and random.random() < config.hang_rate:
+        stats["injectedHangs"] += 1
+        await asyncio.sleep(config.hang_seconds)
+    if config.failure_rate and random.random() < config.failure_rate:
+        stats["injectedFailures"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail={"name": "SERVICE_UNAVAILABLE", "message": "Injected failure"}
+        )
+
+def _require_token(authorization: Optional[str]):
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail={"error": "invalid_token"})
+    token = authorization.split(" ", 1)[1]
+    expires_at = tokens.get(token)
+    if expires_at is None or expires_at < datetime.utcnow().timestamp():
+        raise HTTPException(status_code=401, detail={"error": "invalid_token"})
+
+def _links(request: Request, payment_id: str, token: str):
+    base = _base_url(request)
+    return [
+        {"href": f"{base}/v1/payments/payment/{payment_id}", "rel": "self", "method": "GET"},
+        {"href": f"{base}/checkoutnow?token={token}&paymentId={payment_id}", "rel": "approval_url", "method": "REDIRECT"},
+        {"href": f"{base}/v1/payments/payment/{payment_id}/execute", "rel": "execute", "method": "POST"}
+    ]
+
+def _public(payment: Dict) -> Dict:
+    return {key: value for key, value in payment.items() if not key.startswith("_")}
+
+async def send_webhook(event_type: str, resource: Dict) -> Optional[int]:
+    """POST a PayPal-style webhook event to the configured backend URL"""
+    if not config.webhook_url:
+        return None
+    event = {
+        "id": f"WH-{uuid.uuid4().hex[:17].upper()}",
+        "event_version": "1.0",
+        "create_time": datetime.utcnow().isoformat() + "Z",
+        "resource_type": "sale" if event_type.startswith("PAYMENT.SALE") else "payment",
+        "event_type": event_type,
+        "resource": resource
+    }
+    headers = {
+        "PAYPAL-TRANSMISSION-ID": str(uuid.uuid4()),
+        "PAYPAL-TRANSMISSION-TIME": event["create_time"],
+        "PAYPAL-TRANSMISSION-SIG": base64.b64encode(secrets.token_bytes(32)).decode(),
+        "PAYPAL-CERT-URL": "https://fake-paypal.local/cert.pem",
+        "PAYPAL-AUTH-ALGO": "SHA256withRSA"
+    }
+    async with httpx.AsyncClient(timeout=10) as client:
+        response = await client.post(config.webhook_url, json=event, headers=headers)
+    stats["webhooksSent"] += 1
+    return response.status_code
+
+def _sale_resource(payment: Dict) -> Dict:
+    transaction = payment["transactions"][0]
+    return {
+        "id": payment["_saleId"],
+        "state": "completed",
+        "amount": {"total": transaction["amount"]["total"], "currency": transaction["amount"]["currency"]},
+        "parent_payment": payment["id"],
+        "create_time": payment["update_time"]
+    }
+
+def _complete(payment: Dict, payer_id: str):
+    now = datetime.utcnow().isoformat() + "Z"
+    payment["state"] = "approved"
+    payment["update_time"] = now
+    payment["payer"]["payer_info"] = {"payer_id": payer_id}
+    payment["_saleId"] = f"SALE-{uuid.uuid4().hex[:17].upper()}"
+    payment["transactions"][0]["related_resources"] = [{"sale": {
+        "id": payment["_saleId"],
+        "state": "completed",
+        "amount": payment["transactions"][0]["amount"],
+        "parent_payment": payment["id"]
+    }}]
+
+# PayPal REST endpoints
+
+@app.post("/v1/oauth2/token")
+async def oauth_token(request: Request, authorization: Optional[str] = Header(None)):
+    await _simulate(request)
+    if not authorization or not authorization.startswith("Basic "):
+        raise HTTPException(status_code=401, detail={"error": "invalid_client"})
+    token = f"A21AA{secrets.token_urlsafe(32)}"
+    tokens[token] = datetime.utcnow().timestamp() + config.token_expires_in
+    return {
+        "scope": "https://uri.paypal.com/services/payments/payment",
+        "access_token": token,
+        "token_type": "Bearer",
+        "app_id": "APP-FAKE",
+        "expires_in": config.token_expires_in,
+        "nonce": secrets.token_hex(8)
+    }
+
+@app.post("/v1/payments/payment", status_code=201)
+async def create_payment(body: Dict, request: Request, authorization: Optional[str] = Header(None)):
+    await _simulate(request)
+    _require_token(authorization)
+    if not body.get("transactions"):
+        raise HTTPException(status_code=400, detail={"name": "VALIDATION_ERROR", "message": "transactions required"})
+
+    payment_id = f"PAYID-{uuid.uuid4().hex[:24].upper()}"
+    token = f"EC-{uuid.uuid4().hex[:17].upper()}"
+    now = datetime.utcnow().isoformat() + "Z"
+    payment = {
+        "id": payment_id,
+        "intent": body.get("intent", "sale"),
+        "state": "created",
+        "payer": dict(body.get("payer", {})),
+        "transactions": body["transactions"],
+        "redirect_urls": body.get("redirect_urls", {}),
+        "create_time": now,
+        "update_time": now,
+        "links": _links(request, payment_id, token),
+        "_token": token
+    }
+    payments[payment_id] = payment
+    return _public(payment)
+
+@app.get("/v1/payments/payment/{payment_id}")
+async def find_payment(payment_id: str, request: Request, authorization: Optional[str] = Header(None)):
+    await _simulate(request)
+    _require_token(authorization)
+    payment = payments.get(payment_id)
+    if not payment:
+        raise HTTPException(status_code=404, detail={"name": "INVALID_RESOURCE_ID"})
+    return _public(payment)
+
+@app.post("/v1/payments/payment/{payment_id}/execute")
+async def execute_payment(payment_id: str, body: Dict, request: Request, authorization: Optional[str] = Header(None)):
+    await _simulate(request)
+    _require_token(authorization)
+    payment = payments.get(payment_id)
+    if not payment:
+        raise HTTPException(status_code=404, detail={"name": "INVALID_RESOURCE_ID"})
+    if payment["state"] == "approved":
+        raise HTTPException(status_code=400, detail={"name": "PAYMENT_ALREADY_DONE"})
+    if payment.get("_approvedPayerId") != body.get("payer_id"):
+        raise HTTPException(status_code=400, detail={"name": "PAYMENT_NOT_APPROVED_FOR_EXECUTION"})
+
+    _complete(payment, body["payer_id"])
+    asyncio.create_task(send_webhook("PAYMENT.SALE.COMPLETED", _sale_resource(payment)))
+    return _public(payment)
+
+@app.post("/v1/notifications/verify-webhook-signature")
+async def verify_webhook_signature(body: Dict, request: Request, authorization: Optional[str] = Header(None)):
+    await _simulate(request)
+    _require_token(authorization)
+    valid = bool(body.get("transmission_sig")) and bool(body.get("webhook_event"))
+    return {"verification_status": "SUCCESS" if valid else "FAILURE"}
+
+# Buyer-facing approval page: approves immediately and redirects back
+
+@app.get("/checkoutnow")
+async def approve_payment(paymentId: str, token: str):
+    payment = payments.get(paymentId)
+    if not payment or payment["_token"] != token:
+        raise HTTPException(status_code=404, detail="Unknown payment")
+    payer_id = payment.get("_approvedPayerId") or f"PAYER{uuid.uuid4().hex[:8].upper()}"
+    payment["_approvedPayerId"] = payer_id
+    return_url = payment["redirect_urls"].get("return_url", "/")
+    separator = "&" if "?" in return_url else "?"
+    return RedirectResponse(f"{return_url}{separator}paymentId={paymentId}&token={token}&PayerID={payer_id}")
+
+# Test controls
+
+@app.get("/fake/config")
+async def get_config():
+    return config
+
+@app.put("/fake/config")
+async def update_config(update: Dict):
+    global config
+    config = config.model_copy(update=update)
+    return config
+
+@app.get("/fake/stats")
+async def get_stats():
+    states = {}
+    for payment in payments.values():
+        states[payment["state"]] = states.get(payment["state"], 0) + 1
+    return {**stats, "payments": len(payments), "paymentStates": states}
+
+@app.post("/fake/payments/{payment_id}/complete")
+async def complete_without_execute(payment_id: str):
+    """Approve and capture a payment and send its webhook, as if the buyer's redirect was lost"""
+    payment = payments.get(payment_id)
+    if not payment:
+        raise HTTPException(status_code=404, detail="Unknown payment")
+    if payment["state"] != "approved":
+        _complete(payment, payment.get("_approvedPayerId") or f"PAYER{uuid.uuid4().hex[:8].upper()}")
+    status_code = await send_webhook("PAYMENT.SALE.COMPLETED", _sale_resource(payment))
+    return {"payment": _public(payment), "webhookStatus": status_code}
+
+@app.post("/fake/reset")
+async def reset():
+    payments.clear()
+    tokens.clear()
+    for key in stats:
+        stats[key] = 0
+    return JSONResponse({"message": "reset"})
+
+if __name__ == "__main__":
+    import uvicorn
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("FAKE_PAYPAL_PORT", "8099")))
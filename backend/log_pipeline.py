@@ -0,0 +1,118 @@
+"""
+Non-blocking logging.
+
+Handlers on the request path only stamp the record (request id), apply
+sampling and put it on a bounded queue; a QueueListener thread does the
+message formatting and the stream writes. When the queue is full records are
+dropped and counted rather than blocking the event loop.
+
+LOG_FORMAT=json (default) writes one JSON object per line; LOG_FORMAT=text
+keeps the classic "time - logger - level - message" lines.
+LOG_SAMPLING keeps a fraction of INFO and DEBUG records per logger, e.g.
+"routers.questions=0.1,httpx=0"; warnings and errors are never sampled.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Per-request correlation id, set by RequestContextMiddleware
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+def _parse_sampling(value: str) -> Dict[str, float]:
+    rates = {}
+    for entry in filter(None, value.split(",")):
+        name, _, rate = entry.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+LOG_SAMPLING = _parse_sampling(os.getenv("LOG_SAMPLING", "routers.questions=0.1"))
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of INFO/DEBUG records from high-volume loggers"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rates.get(record.name)
+        return rate is None or random.random() < rate
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if getattr(record, "request_id", None):
+            entry["requestId"] = record.request_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records unformatted; stamp the request id while the caller's context is current"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Message formatting is left to the listener thread
+        record.request_id = request_id.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_queue_handler: Optional[ContextQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def configure_logging():
+    """Route the root and uvicorn loggers through the background queue listener"""
+    global _queue_handler, _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler = ContextQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter(LOG_SAMPLING))
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+
+    root = logging.getLogger()
+    root.handlers = [_queue_handler]
+    root.setLevel(LOG_LEVEL)
+    # uvicorn installs its own synchronous stream handlers
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    _listener.start()
+    # Stop (and flush) at exit rather than at lifespan shutdown, so shutdown logs still get written
+    atexit.register(_listener.stop)
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler else 0
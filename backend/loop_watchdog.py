@@ -0,0 +1,129 @@
+"""
+Event loop blocking detector.
+
+A heartbeat task on the loop stamps the time every few milliseconds; a
+watchdog thread notices when the stamp stops moving. Once the loop has been
+stuck for LOOP_BLOCK_THRESHOLD_MS it captures the loop thread's Python stack,
+which is the code doing the blocking (bcrypt, a synchronous SDK call, pandas
+parsing...), and logs it with the route being served.
+
+Off unless LOOP_WATCHDOG=1; meant for staging and load tests.
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, Optional
+import os
+import logging
+
+from db_monitoring import route_for_task
+
+logger = logging.getLogger(__name__)
+
+LOOP_WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG", "").lower() in ("1", "true", "yes")
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+LOOP_BLOCK_LOG_SIZE = int(os.getenv("LOOP_BLOCK_LOG_SIZE", "100"))
+# Innermost frames kept per captured stack
+STACK_DEPTH = 30
+
+class LoopWatchdog:
+    def __init__(self, threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS, log_size: int = LOOP_BLOCK_LOG_SIZE):
+        self.threshold = threshold_ms / 1000
+        self.interval = max(self.threshold / 4, 0.005)
+        self.incidents = deque(maxlen=log_size)
+        self.total_incidents = 0
+        self._lock = threading.Lock()
+        self._beat = time.monotonic()
+        self._open: Optional[Dict] = None
+        self._stop = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Event loop watchdog started (threshold {self.threshold * 1000:.0f}ms)")
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                incident, self._open = self._open, None
+                last_beat, self._beat = self._beat, now
+            if incident is not None:
+                # The stall ran from the missed wake-up until now
+                incident["blockedMs"] = round((now - last_beat - self.interval) * 1000, 1)
+                logger.warning(
+                    f"Event loop was blocked for {incident['blockedMs']}ms in {incident['route']}"
+                )
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                stalled = time.monotonic() - self._beat - self.interval
+                if stalled < self.threshold or self._open is not None:
+                    continue
+                incident = self._capture(stalled)
+                self._open = incident
+                self.incidents.append(incident)
+                self.total_incidents += 1
+            logger.warning(
+                f"Event loop blocked for {incident['blockedMs']}ms so far in {incident['route']} "
+                f"({incident['task']}):\n{incident['stack']}"
+            )
+
+    def _capture(self, stalled: float) -> Dict:
+        """Snapshot of what the loop thread is running right now"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame, limit=STACK_DEPTH)) if frame else ""
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        return {
+            "at": time.time(),
+            "blockedMs": round(stalled * 1000, 1),
+            "route": route_for_task(task),
+            "task": task.get_name() if task is not None else "callback",
+            "stack": stack
+        }
+
+    def stats(self, limit: int = 20) -> Dict:
+        with self._lock:
+            incidents = [dict(incident) for incident in list(self.incidents)[-limit:]]
+        return {
+            "enabled": self._thread is not None,
+            "thresholdMs": self.threshold * 1000,
+            "totalIncidents": self.total_incidents,
+            "incidents": list(reversed(incidents))
+        }
+
+loop_watchdog = LoopWatchdog()
+
+def start_loop_watchdog():
+    if LOOP_WATCHDOG_ENABLED:
+        loop_watchdog.start()
+
+async def stop_loop_watchdog():
+    await loop_watchdog.stop()
@@ -0,0 +1,223 @@
+"""
+Prometheus text-format metrics for this worker.
+
+Request latency is recorded by MetricsMiddleware as a histogram per method,
+route template and status (request rate is the rate of its _count series).
+Everything else is read from the existing in-process counters when
+``/api/metrics`` is scraped, so the only per-request cost is one histogram
+update.
+"""
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import os
+import logging
+
+from cache import CACHES
+from database import pool_stats
+from db_monitoring import command_metrics
+from auth import password_executor_stats
+from loop_watchdog import loop_watchdog
+from log_pipeline import dropped_records
+from tracing import exporter as span_exporter
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+class Histogram:
+    """Cumulative-bucket histogram; only touched from the event loop, so no locking"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Iterable[Tuple[str, int]]:
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield repr(bound), total
+        yield "+Inf", self.count
+
+class RequestMetrics:
+    def __init__(self):
+        self.latency: Dict[Tuple[str, str, str], Histogram] = {}
+        self.in_flight = 0
+        self.loop_lag = Histogram(LOOP_LAG_BUCKETS)
+        self.loop_lag_max = 0.0
+
+    def observe_request(self, method: str, route: str, status: str, seconds: float):
+        key = (method, route, status)
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(seconds)
+
+    def observe_loop_lag(self, seconds: float):
+        self.loop_lag.observe(seconds)
+        self.loop_lag_max = max(self.loop_lag_max, seconds)
+
+request_metrics = RequestMetrics()
+
+class MetricsMiddleware:
+    """Time every HTTP request by route template (unmatched paths share one label)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status_code = "500"
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = str(message["status"])
+            await send(message)
+
+        request_metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_metrics.in_flight -= 1
+            route = scope.get("route")
+            request_metrics.observe_request(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status_code,
+                time.perf_counter() - started
+            )
+
+# Event loop lag: how late a periodic sleep wakes up
+
+_tasks: List[asyncio.Task] = []
+
+async def _loop_lag_monitor():
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LOOP_LAG_INTERVAL_SECONDS
+        await asyncio.sleep(LOOP_LAG_INTERVAL_SECONDS)
+        request_metrics.observe_loop_lag(max(loop.time() - expected, 0.0))
+
+def start_loop_lag_monitor():
+    _tasks.append(asyncio.create_task(_loop_lag_monitor()))
+
+async def stop_loop_lag_monitor():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+
+# Exposition
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(labels: Optional[Dict]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+class _Writer:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def family(self, name: str, metric_type: str, help_text: str):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {metric_type}")
+
+    def sample(self, name: str, value, labels: Optional[Dict] = None):
+        self.lines.append(f"{name}{_labels(labels)} {float(value)!r}")
+
+    def histogram(self, name: str, histogram: Histogram, labels: Optional[Dict] = None):
+        labels = labels or {}
+        for bound, count in histogram.cumulative():
+            self.sample(f"{name}_bucket", count, {**labels, "le": bound})
+        self.sample(f"{name}_sum", histogram.sum, labels)
+        self.sample(f"{name}_count", histogram.count, labels)
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+def render_metrics() -> str:
+    out = _Writer()
+
+    out.family("http_request_duration_seconds", "histogram", "Request latency by route template and status")
+    for (method, route, status_code), histogram in list(request_metrics.latency.items()):
+        out.histogram("http_request_duration_seconds", histogram,
+                      {"method": method, "route": route, "status": status_code})
+
+    out.family("http_requests_in_flight", "gauge", "Requests currently being served")
+    out.sample("http_requests_in_flight", request_metrics.in_flight)
+
+    out.family("event_loop_lag_seconds", "histogram", "How late the event loop ran a periodic timer")
+    out.histogram("event_loop_lag_seconds", request_metrics.loop_lag)
+    out.family("event_loop_lag_max_seconds", "gauge", "Worst event loop lag seen")
+    out.sample("event_loop_lag_max_seconds", request_metrics.loop_lag_max)
+    out.family("event_loop_block_incidents_total", "counter", "Stalls caught by the loop watchdog (LOOP_WATCHDOG=1)")
+    out.sample("event_loop_block_incidents_total", loop_watchdog.total_incidents)
+
+    caches = [cache.stats() for cache in list(CACHES.values())]
+    out.family("cache_requests_total", "counter", "Cache lookups by result (hit, stale, miss)")
+    for stats in caches:
+        out.sample("cache_requests_total", stats["hits"], {"cache": stats["name"], "result": "hit"})
+        out.sample("cache_requests_total", stats["staleHits"], {"cache": stats["name"], "result": "stale"})
+        out.sample("cache_requests_total", stats["misses"], {"cache": stats["name"], "result": "miss"})
+    out.family("cache_hit_ratio", "gauge", "Fresh and stale hits over all lookups")
+    for stats in caches:
+        out.sample("cache_hit_ratio", stats["hitRatio"], {"cache": stats["name"]})
+    out.family("cache_entries", "gauge", "Entries held per cache")
+    for stats in caches:
+        out.sample("cache_entries", stats["entries"], {"cache": stats["name"]})
+
+    operations = command_metrics.stats(limit=None)["operations"]
+    out.family("mongo_command_duration_seconds", "summary", "MongoDB command latency by route, collection and command")
+    for op in operations:
+        labels = {"route": op["route"], "collection": op["collection"] or "", "command": op["command"]}
+        out.sample("mongo_command_duration_seconds_sum", op["totalMs"] / 1000, labels)
+        out.sample("mongo_command_duration_seconds_count", op["count"], labels)
+    out.family("mongo_command_failures_total", "counter", "MongoDB commands that failed")
+    for op in operations:
+        labels = {"route": op["route"], "collection": op["collection"] or "", "command": op["command"]}
+        out.sample("mongo_command_failures_total", op["failures"], labels)
+
+    pool = pool_stats()
+    out.family("mongo_pool_checked_out_connections", "gauge", "Connections currently checked out")
+    out.sample("mongo_pool_checked_out_connections", pool["checkedOut"])
+    out.family("mongo_pool_open_connections", "gauge", "Open pooled connections")
+    out.sample("mongo_pool_open_connections", pool["open"])
+    out.family("mongo_pool_max_size", "gauge", "Configured maxPoolSize")
+    out.sample("mongo_pool_max_size", pool["maxPoolSize"] or 0)
+    out.family("mongo_pool_checkouts_total", "counter", "Connection checkouts")
+    out.sample("mongo_pool_checkouts_total", pool["checkouts"])
+    out.family("mongo_pool_checkout_wait_seconds_p95", "gauge", "p95 wait for a pooled connection (recent checkouts)")
+    out.sample("mongo_pool_checkout_wait_seconds_p95", pool["waitMs"]["p95"] / 1000)
+
+    executor = password_executor_stats()
+    out.family("password_hash_workers", "gauge", "Processes in the bcrypt hashing pool")
+    out.sample("password_hash_workers", executor["workers"])
+    out.family("password_hash_queue_depth", "gauge", "Hashing batches submitted to the pool and not yet finished")
+    out.sample("password_hash_queue_depth", executor["queued"])
+
+    out.family("log_records_dropped_total", "counter", "Log records dropped because the log queue was full")
+    out.sample("log_records_dropped_total", dropped_records())
+
+    spans = span_exporter.stats()
+    out.family("trace_spans_exported_total", "counter", "Spans written by the trace exporter")
+    out.sample("trace_spans_exported_total", spans["exported"])
+    out.family("trace_spans_dropped_total", "counter", "Spans dropped because the export queue was full")
+    out.sample("trace_spans_dropped_total", spans["dropped"])
+
+    return out.text()
@@ -0,0 +1,215 @@
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+import logging
+
+from database import (
+    get_database, connect_to_mongo, close_mongo_connection,
+    QUESTIONS_COLLECTION, SUBSCRIPTIONS_COLLECTION, PAYMENTS_COLLECTION, MIGRATIONS_COLLECTION
+)
+from subscription_state import subscription_end_date
+from entitlement import backfill_entitlements
+from revenue_rollups import backfill_conversions
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "500"))
+
+# Current canonical schema version of question documents
+QUESTION_SCHEMA_VERSION = 1
+# Current schema version of subscription documents
+SUBSCRIPTION_SCHEMA_VERSION = 2
+
+DEFAULT_TRUE_FALSE_OPTIONS = {"es": ["Verdadero", "Falso"], "en": ["True", "False"]}
+
+def normalize_question_type(value) -> str:
+    """Map legacy type spellings ("multiple-choice", "True False") to the enum value"""
+    return str(value or "multiple_choice").strip().lower().replace("-", "_").replace(" ", "_")
+
+def _bilingual(value) -> Dict[str, str]:
+    if isinstance(value, dict):
+        return {"es": str(value.get("es", "")), "en": str(value.get("en", ""))}
+    text = "" if value is None else str(value)
+    return {"es": text, "en": text}
+
+def _bilingual_options(value) -> Dict[str, List[str]]:
+    if isinstance(value, dict):
+        es = list(value.get("es", value.get("en", [])))
+        en = list(value.get("en", es))
+        return {"es": es, "en": en}
+    if isinstance(value, list):
+        return {"es": list(value), "en": list(value)}
+    return {"es": [], "en": []}
+
+def canonical_question(doc: Dict) -> Dict:
+    """Return the canonical fields of a question document.
+
+    Canonical shape: bilingual dicts for question/explanation/options, enum
+    type values, integer correctAnswer for multiple choice and boolean
+    correctAnswer for true/false (option index 0 is "True", with the fixed
+    Verdadero/Falso options).
+    """
+    question_type = normalize_question_type(doc.get("type"))
+    options = _bilingual_options(doc.get("options"))
+    correct_answer = doc.get("correctAnswer", 0)
+
+    if question_type == "true_false":
+        options = {lang: list(values) for lang, values in DEFAULT_TRUE_FALSE_OPTIONS.items()}
+        if not isinstance(correct_answer, bool):
+            correct_answer = int(correct_answer) == 0
+    else:
+        correct_answer = int(correct_answer)
+
+    now = datetime.utcnow()
+    return {
+        "topicId": int(doc.get("topicId", 1)),
+        "type": question_type,
+        "question": _bilingual(doc.get("question")),
+        "options": options,
+        "correctAnswer": correct_answer,
+        "explanation": _bilingual(doc.get("explanation")),
+        "difficulty": str(doc.get("difficulty") or "medium").lower(),
+        "createdAt": doc.get("createdAt") or now,
+        "updatedAt": doc.get("updatedAt") or now,
+        "schemaVersion": QUESTION_SCHEMA_VERSION
+    }
+
+class Migration(NamedTuple):
+    collection: str
+    version: int
+    description: str
+    # Returns ($set, $unset) for one document
+    transform: Callable[[Dict], tuple]
+    # Optional side effect for each batch of original documents
+    after_batch: Optional[Callable[[object, List[Dict]], Awaitable[None]]] = None
+
+MIGRATIONS: List[Migration] = []
+
+def migration(collection: str, version: int, description: str, after_batch=None):
+    """Register a document migration for a collection"""
+    def decorator(func):
+        MIGRATIONS.append(Migration(collection, version, description, func, after_batch))
+        return func
+    return decorator
+
+@migration(QUESTIONS_COLLECTION, 1, "Normalize legacy question shapes to the canonical schema")
+def _questions_v1(doc: Dict):
+    # Bulk imports used to store a redundant uuid "id" next to _id
+    unset = {"id": ""} if "id" in doc else {}
+    return canonical_question(doc), unset
+
+@migration(SUBSCRIPTIONS_COLLECTION, 1, "Add endDate (end of the current access period) for the expiry sweeper")
+def _subscriptions_v1(doc: Dict):
+    return {"endDate": subscription_end_date(doc), "schemaVersion": 1}, {}
+
+@migration(SUBSCRIPTIONS_COLLECTION, 2, "Copy subscription entitlements onto user documents",
+           after_batch=backfill_entitlements)
+def _subscriptions_v2(doc: Dict):
+    return {"schemaVersion": 2}, {}
+
+@migration(PAYMENTS_COLLECTION, 1, "Add completedAt to completed payments for revenue rollups")
+def _payments_v1(doc: Dict):
+    fields = {"schemaVersion": 1}
+    if doc.get("status") == "completed" and not doc.get("completedAt"):
+        fields["completedAt"] = doc.get("updatedAt") or doc.get("createdAt")
+    return fields, {}
+
+@migration(PAYMENTS_COLLECTION, 2, "Flag each user's first completed payment as a trial -> paid conversion",
+           after_batch=backfill_conversions)
+def _payments_v2(doc: Dict):
+    return {"schemaVersion": 2}, {}
+
+def _pending_filter(version: int) -> Dict:
+    return {"schemaVersion": {"$not": {"$gte": version}}}
+
+async def apply_migration(db, item: Migration, batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """Rewrite every document below the migration version, in _id-ordered batches.
+
+    A document the transform cannot handle is logged and left unversioned
+    rather than failing the run (migrations run at startup).
+    """
+    collection = db[item.collection]
+    pending = _pending_filter(item.version)
+    migrated = 0
+    skipped = 0
+    last_id = None
+
+    while True:
+        query = dict(pending)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await collection.find(query).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+
+        operations = []
+        transformed = []
+        for doc in batch:
+            try:
+                set_fields, unset_fields = item.transform(doc)
+            except Exception as e:
+                skipped += 1
+                logger.warning(f"Migration {item.collection}:{item.version} skipped document {doc['_id']}: {e}")
+                continue
+            update = {"$set": set_fields}
+            if unset_fields:
+                update["$unset"] = unset_fields
+            # Re-check the version so concurrent runners never apply twice
+            operations.append(UpdateOne({"_id": doc["_id"], **pending}, update))
+            transformed.append(doc)
+
+        if operations:
+            result = await collection.bulk_write(operations, ordered=False)
+            if item.after_batch:
+                await item.after_batch(db, transformed)
+            migrated += result.modified_count
+        last_id = batch[-1]["_id"]
+
+    if skipped:
+        logger.warning(f"Migration {item.collection}:{item.version} left {skipped} documents unversioned")
+    return migrated
+
+async def run_migrations(batch_size: int = MIGRATION_BATCH_SIZE) -> Dict[str, int]:
+    """Apply all registered migrations that have not completed yet"""
+    db = await get_database()
+    applied = {}
+
+    for item in sorted(MIGRATIONS, key=lambda m: (m.collection, m.version)):
+        key = f"{item.collection}:{item.version}"
+        if await db[MIGRATIONS_COLLECTION].find_one({"_id": key}):
+            continue
+
+        logger.info(f"Applying migration {key}: {item.description}")
+        migrated = await apply_migration(db, item, batch_size)
+        await db[MIGRATIONS_COLLECTION].update_one(
+            {"_id": key},
+            {"$set": {
+                "description": item.description,
+                "migratedCount": migrated,
+                "appliedAt": datetime.utcnow()
+            }},
+            upsert=True
+        )
+        applied[key] = migrated
+        logger.info(f"Migration {key} rewrote {migrated} documents")
+
+    return applied
+
+async def migrate_database():
+    try:
+        await connect_to_mongo()
+        await run_migrations()
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(migrate_database())
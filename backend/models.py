@@ -32,6 +32,11 @@ class SubscriptionStatus(str, Enum):
     expired = "expired"
     cancelled = "cancelled"
 
+class ExportFormat(str, Enum):
+    csv = "csv"
+    xlsx = "xlsx"
+    parquet = "parquet"
+
 class PaymentStatus(str, Enum):
     pending = "pending"
     completed = "completed"
@@ -75,6 +80,20 @@ class Payment(BaseModel):
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     updatedAt: datetime = Field(default_factory=datetime.utcnow)
 
+class PaymentResponse(BaseModel):
+    id: str
+    amount: float
+    currency: str
+    status: PaymentStatus
+    createdAt: datetime
+
+class PaymentSummary(BaseModel):
+    totalPaid: float = 0.0
+    currency: str = "USD"
+    completedPayments: int = 0
+    lastPaymentAt: Optional[datetime] = None
+    lastPaymentAmount: Optional[float] = None
+
 class PaymentCreate(BaseModel):
     subscriptionId: str
     amount: float = 10.0
@@ -97,6 +116,11 @@ class SubscriptionResponse(BaseModel):
     isActive: bool = False
     createdAt: datetime
 
+class Entitlement(BaseModel):
+    """Denormalized subscription state stored on the user document"""
+    status: SubscriptionStatus
+    expiresAt: Optional[datetime] = None
+
 # User Models
 class UserBase(BaseModel):
     username: str
@@ -116,6 +140,7 @@ class UserResponse(UserBase):
     id: str
     progress: UserProgress
     subscription: Optional[SubscriptionResponse] = None
+    entitlement: Optional[Entitlement] = None
     createdAt: datetime
     
 class UserUpdate(BaseModel):
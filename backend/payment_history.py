@@ -0,0 +1,66 @@
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+import os
+from bson import ObjectId
+
+from database import PAYMENTS_COLLECTION
+from models import PaymentStatus, PaymentSummary
+from cache import create_cache
+
+# Per-user payment totals; completions and refunds invalidate the entry
+payment_summary_cache = create_cache(
+    "payment_summary",
+    ttl=float(os.getenv("PAYMENT_SUMMARY_TTL_SECONDS", "300")),
+    max_entries=int(os.getenv("PAYMENT_SUMMARY_CACHE_SIZE", "10000"))
+)
+
+def encode_payment_cursor(payment: Dict) -> str:
+    """Keyset cursor for the (createdAt desc, _id desc) payment order"""
+    return f"{payment['createdAt'].isoformat()}_{payment['id']}"
+
+def payment_page_query(user_id: str, before: Optional[str] = None) -> Dict:
+    """Payments of a user older than the cursor; raises ValueError for malformed cursors"""
+    query = {"userId": user_id}
+    if before:
+        created_at, payment_id = _decode_payment_cursor(before)
+        query["$or"] = [
+            {"createdAt": {"$lt": created_at}},
+            {"createdAt": created_at, "_id": {"$lt": payment_id}}
+        ]
+    return query
+
+def _decode_payment_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    created_at, _, payment_id = cursor.rpartition("_")
+    if not ObjectId.is_valid(payment_id):
+        raise ValueError("Invalid cursor")
+    return datetime.fromisoformat(created_at), ObjectId(payment_id)
+
+async def compute_payment_summary(db, user_id: str) -> PaymentSummary:
+    """Total paid and the latest completed payment, from the {userId, createdAt} index"""
+    result = await db[PAYMENTS_COLLECTION].aggregate([
+        {"$match": {"userId": user_id, "status": PaymentStatus.completed.value}},
+        {"$sort": {"createdAt": -1}},
+        {"$group": {
+            "_id": "$currency",
+            "totalPaid": {"$sum": "$amount"},
+            "completedPayments": {"$sum": 1},
+            "lastPaymentAt": {"$first": "$createdAt"},
+            "lastPaymentAmount": {"$first": "$amount"}
+        }},
+        {"$sort": {"lastPaymentAt": -1}},
+        {"$limit": 1}
+    ]).to_list(length=1)
+
+    if not result:
+        return PaymentSummary()
+    summary = result[0]
+    return PaymentSummary(
+        totalPaid=round(summary["totalPaid"], 2),
+        currency=summary["_id"] or "USD",
+        completedPayments=summary["completedPayments"],
+        lastPaymentAt=summary["lastPaymentAt"],
+        lastPaymentAmount=summary["lastPaymentAmount"]
+    )
+
+async def get_payment_summary(db, user_id: str) -> PaymentSummary:
+    return await payment_summary_cache.get(user_id, lambda: compute_payment_summary(db, user_id))
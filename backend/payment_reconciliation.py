@@ -0,0 +1,255 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List
+import os
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+import logging
+
+from database import (
+    get_database, transaction, PAYMENTS_COLLECTION, SUBSCRIPTIONS_COLLECTION, PAYPAL_EVENTS_COLLECTION
+)
+from models import PaymentStatus, SubscriptionStatus
+from paypal_gateway import get_paypal_gateway, PayPalError
+from resilience import ProviderUnavailable
+from payment_history import payment_summary_cache
+from entitlement import set_entitlements
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_PERIOD = timedelta(days=30)
+EVENT_BATCH_SIZE = int(os.getenv("PAYPAL_EVENT_BATCH_SIZE", "100"))
+EVENT_POLL_SECONDS = float(os.getenv("PAYPAL_EVENT_POLL_SECONDS", "5"))
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("PAYMENT_RECONCILE_INTERVAL_SECONDS", "300"))
+# Pending payments older than this are checked against PayPal
+RECONCILE_AFTER = timedelta(minutes=int(os.getenv("PAYMENT_RECONCILE_AFTER_MINUTES", "15")))
+# PayPal approval links expire after three hours
+PAYMENT_APPROVAL_EXPIRY = timedelta(hours=3)
+RECONCILE_BATCH_SIZE = 50
+
+# Webhook event type -> resulting payment status
+SALE_EVENT_STATUS = {
+    "PAYMENT.SALE.COMPLETED": PaymentStatus.completed,
+    "PAYMENT.SALE.DENIED": PaymentStatus.failed,
+    "PAYMENT.SALE.REFUNDED": PaymentStatus.refunded,
+    "PAYMENT.SALE.REVERSED": PaymentStatus.refunded,
+}
+
+_new_events = asyncio.Event()
+_tasks: List[asyncio.Task] = []
+
+async def complete_payments(db, completions: Dict[str, str]) -> List[str]:
+    """Mark pending payments completed and activate their subscriptions.
+
+    ``completions`` maps PayPal payment id (paypalOrderId) to the id stored as
+    paypalPaymentId. Only payments still pending transition, so replays from
+    execute, webhooks and reconciliation never extend a subscription twice.
+    Returns the user ids whose subscriptions were activated.
+    """
+    if not completions:
+        return []
+
+    pending = await db[PAYMENTS_COLLECTION].find(
+        {"paypalOrderId": {"$in": list(completions)}, "status": PaymentStatus.pending.value},
+        {"paypalOrderId": 1, "userId": 1}
+    ).to_list(length=len(completions))
+    if not pending:
+        return []
+
+    now = datetime.utcnow()
+    user_ids = list({payment["userId"] for payment in pending})
+    end_date = now + SUBSCRIPTION_PERIOD
+    # A user's first paid period is a trial -> paid conversion
+    converted = set(await db[SUBSCRIPTIONS_COLLECTION].distinct(
+        "userId", {"userId": {"$in": user_ids}, "subscriptionStartDate": None}
+    ))
+    async with transaction() as session:
+        await db[PAYMENTS_COLLECTION].bulk_write([
+            UpdateOne(
+                {"_id": payment["_id"], "status": PaymentStatus.pending.value},
+                {"$set": {
+                    "paypalPaymentId": completions[payment["paypalOrderId"]],
+                    "status": PaymentStatus.completed.value,
+                    "completedAt": now,
+                    "conversion": payment["userId"] in converted,
+                    "updatedAt": now
+                }}
+            )
+            for payment in pending
+        ], ordered=False, session=session)
+
+        await db[SUBSCRIPTIONS_COLLECTION].bulk_write([
+            UpdateOne(
+                {"userId": user_id},
+                {"$set": {
+                    "status": SubscriptionStatus.active.value,
+                    "subscriptionStartDate": now,
+                    "subscriptionEndDate": end_date,
+                    "endDate": end_date,
+                    "updatedAt": now
+                }}
+            )
+            for user_id in user_ids
+        ], ordered=False, session=session)
+
+        await set_entitlements(db, {
+            user_id: {"status": SubscriptionStatus.active.value, "expiresAt": end_date}
+            for user_id in user_ids
+        }, session=session)
+
+    for user_id in user_ids:
+        payment_summary_cache.invalidate(user_id)
+
+    logger.info(f"Completed {len(pending)} payments, activated {len(user_ids)} subscriptions")
+    return user_ids
+
+async def set_payment_status(db, paypal_ids: List[str], payment_status: PaymentStatus) -> int:
+    """Move payments to failed/refunded in one write"""
+    if not paypal_ids:
+        return 0
+    query = {"paypalOrderId": {"$in": paypal_ids}, "status": {"$ne": payment_status.value}}
+    # Refunds change a user's totals
+    user_ids = await db[PAYMENTS_COLLECTION].distinct("userId", query)
+    result = await db[PAYMENTS_COLLECTION].update_many(
+        query, {"$set": {"status": payment_status.value, "updatedAt": datetime.utcnow()}}
+    )
+    for user_id in user_ids:
+        payment_summary_cache.invalidate(user_id)
+    return result.modified_count
+
+async def store_webhook_event(db, event: Dict) -> bool:
+    """Persist a verified event keyed by its PayPal id; returns False for redeliveries"""
+    try:
+        await db[PAYPAL_EVENTS_COLLECTION].insert_one({
+            "_id": event["id"],
+            "eventType": event.get("event_type"),
+            "resource": event.get("resource", {}),
+            "createTime": event.get("create_time"),
+            "status": "pending",
+            "receivedAt": datetime.utcnow()
+        })
+    except DuplicateKeyError:
+        return False
+    _new_events.set()
+    return True
+
+async def process_pending_events(db, batch_size: int = EVENT_BATCH_SIZE) -> int:
+    """Apply one batch of stored webhook events to payments and subscriptions"""
+    events = await db[PAYPAL_EVENTS_COLLECTION].find(
+        {"status": "pending"}
+    ).sort("receivedAt", 1).limit(batch_size).to_list(length=batch_size)
+    if not events:
+        return 0
+
+    completions = {}
+    status_updates: Dict[PaymentStatus, List[str]] = {}
+    ignored = []
+    for event in events:
+        payment_status = SALE_EVENT_STATUS.get(event.get("eventType"))
+        paypal_id = (event.get("resource") or {}).get("parent_payment")
+        if payment_status is None or not paypal_id:
+            ignored.append(event["_id"])
+        elif payment_status == PaymentStatus.completed:
+            completions[paypal_id] = paypal_id
+        else:
+            status_updates.setdefault(payment_status, []).append(paypal_id)
+
+    await complete_payments(db, completions)
+    for payment_status, paypal_ids in status_updates.items():
+        await set_payment_status(db, paypal_ids, payment_status)
+
+    now = datetime.utcnow()
+    processed = [event["_id"] for event in events if event["_id"] not in ignored]
+    if processed:
+        await db[PAYPAL_EVENTS_COLLECTION].update_many(
+            {"_id": {"$in": processed}}, {"$set": {"status": "processed", "processedAt": now}}
+        )
+    if ignored:
+        await db[PAYPAL_EVENTS_COLLECTION].update_many(
+            {"_id": {"$in": ignored}}, {"$set": {"status": "ignored", "processedAt": now}}
+        )
+    return len(events)
+
+async def reconcile_stale_payments(db, batch_size: int = RECONCILE_BATCH_SIZE) -> Dict[str, int]:
+    """Ask PayPal about payments that have been pending too long.
+
+    Approved-but-never-executed payments (the buyer's redirect was lost) are
+    executed here; expired or failed ones are marked failed.
+    """
+    now = datetime.utcnow()
+    stale = await db[PAYMENTS_COLLECTION].find(
+        {"status": PaymentStatus.pending.value, "createdAt": {"$lt": now - RECONCILE_AFTER}},
+        {"paypalOrderId": 1, "createdAt": 1}
+    ).sort("createdAt", 1).limit(batch_size).to_list(length=batch_size)
+
+    gateway = get_paypal_gateway()
+    completions = {}
+    failed = []
+    for payment in stale:
+        paypal_id = payment.get("paypalOrderId")
+        if not paypal_id:
+            continue
+        try:
+            remote = await gateway.find_payment(paypal_id)
+            payer_id = ((remote.get("payer") or {}).get("payer_info") or {}).get("payer_id")
+            if remote.get("state") == "created" and payer_id:
+                remote = await gateway.execute_payment(paypal_id, payer_id)
+        except ProviderUnavailable:
+            # PayPal is struggling; try the rest on the next sweep
+            break
+        except PayPalError as e:
+            if e.status_code == 404:
+                failed.append(paypal_id)
+            else:
+                logger.warning(f"Could not reconcile payment {paypal_id}: {e}")
+            continue
+
+        state = remote.get("state")
+        if state == "approved":
+            completions[paypal_id] = remote.get("id", paypal_id)
+        elif state == "failed" or now - payment["createdAt"] > PAYMENT_APPROVAL_EXPIRY:
+            failed.append(paypal_id)
+
+    await complete_payments(db, completions)
+    await set_payment_status(db, failed, PaymentStatus.failed)
+    return {"checked": len(stale), "completed": len(completions), "failed": len(failed)}
+
+async def _event_consumer():
+    while True:
+        _new_events.clear()
+        try:
+            db = await get_database()
+            while await process_pending_events(db) == EVENT_BATCH_SIZE:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"PayPal event consumer error: {e}")
+        try:
+            await asyncio.wait_for(_new_events.wait(), timeout=EVENT_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+async def _reconciliation_loop():
+    while True:
+        await asyncio.sleep(RECONCILE_INTERVAL_SECONDS)
+        try:
+            db = await get_database()
+            result = await reconcile_stale_payments(db)
+            if result["checked"]:
+                logger.info(f"Payment reconciliation: {result}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Payment reconciliation error: {e}")
+
+def start_payment_workers():
+    """Start the webhook event consumer and the reconciliation sweep"""
+    _tasks.append(asyncio.create_task(_event_consumer()))
+    _tasks.append(asyncio.create_task(_reconciliation_loop()))
+
+async def stop_payment_workers():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
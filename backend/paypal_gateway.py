@@ -0,0 +1,215 @@
+import asyncio
+import time
+from typing import Dict, Optional
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+import httpx
+import logging
+
+from resilience import Bulkhead, CircuitBreaker
+from tracing import span
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+PAYPAL_API_URLS = {
+    "sandbox": "https://api-m.sandbox.paypal.com",
+    "live": "https://api-m.paypal.com"
+}
+
+# Refresh the OAuth token this many seconds before PayPal expires it
+TOKEN_EXPIRY_MARGIN = 60
+
+class PayPalError(Exception):
+    """PayPal rejected a request or could not be reached"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, details: Optional[Dict] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.details = details or {}
+
+class PayPalTimeout(PayPalError):
+    """PayPal did not answer within the configured timeout"""
+
+def is_provider_failure(error: BaseException) -> bool:
+    """Timeouts, network errors and 5xx count against the breaker; 4xx are caller errors"""
+    if isinstance(error, PayPalError):
+        return error.status_code is None or error.status_code >= 500
+    return True
+
+class PayPalGateway:
+    """Async PayPal REST client with a pooled keep-alive connection and cached OAuth token.
+
+    Every call goes through a circuit breaker and a concurrency bulkhead, so a
+    slow or failing PayPal is rejected fast with ProviderUnavailable instead of
+    tying up workers.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        client_id: Optional[str],
+        client_secret: Optional[str],
+        timeout: float = 10.0,
+        connect_timeout: float = 3.0,
+        max_connections: int = 20,
+        max_concurrent_calls: int = 10,
+        bulkhead_wait: float = 0.5,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+        self.bulkhead = Bulkhead("paypal", max_concurrent_calls, bulkhead_wait)
+        self.breaker = CircuitBreaker("paypal", failure_threshold, reset_timeout)
+
+    @classmethod
+    def from_env(cls) -> "PayPalGateway":
+        mode = os.getenv("PAYPAL_MODE", "sandbox")  # sandbox or live
+        # PAYPAL_API_BASE points the gateway elsewhere, e.g. at fake_paypal.py
+        base_url = os.getenv("PAYPAL_API_BASE") or PAYPAL_API_URLS.get(mode, PAYPAL_API_URLS["sandbox"])
+        return cls(
+            base_url=base_url,
+            client_id=os.getenv("PAYPAL_CLIENT_ID"),
+            client_secret=os.getenv("PAYPAL_CLIENT_SECRET"),
+            timeout=float(os.getenv("PAYPAL_TIMEOUT_SECONDS", "10")),
+            connect_timeout=float(os.getenv("PAYPAL_CONNECT_TIMEOUT_SECONDS", "3")),
+            max_connections=int(os.getenv("PAYPAL_MAX_CONNECTIONS", "20")),
+            max_concurrent_calls=int(os.getenv("PAYPAL_MAX_CONCURRENT_CALLS", "10")),
+            bulkhead_wait=float(os.getenv("PAYPAL_BULKHEAD_WAIT_SECONDS", "0.5")),
+            failure_threshold=int(os.getenv("PAYPAL_BREAKER_FAILURE_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("PAYPAL_BREAKER_RESET_SECONDS", "30"))
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _get_token(self, force_refresh: bool = False) -> str:
+        """Return the cached OAuth token, fetching a new one when it is about to expire"""
+        if not force_refresh and self._token and time.monotonic() < self._token_expires_at:
+            return self._token
+
+        async with self._token_lock:
+            # Another request may have refreshed it while we waited
+            if not force_refresh and self._token and time.monotonic() < self._token_expires_at:
+                return self._token
+
+            try:
+                response = await self.client.post(
+                    "/v1/oauth2/token",
+                    data={"grant_type": "client_credentials"},
+                    auth=(self.client_id or "", self.client_secret or ""),
+                    headers={"Accept": "application/json"}
+                )
+            except httpx.TimeoutException as e:
+                raise PayPalTimeout(f"PayPal token request timed out: {e}")
+            except httpx.HTTPError as e:
+                raise PayPalError(f"PayPal token request failed: {e}")
+
+            if response.status_code != 200:
+                raise PayPalError("PayPal authentication failed", response.status_code, _json(response))
+
+            data = response.json()
+            self._token = data["access_token"]
+            expires_in = int(data.get("expires_in", 0))
+            self._token_expires_at = time.monotonic() + max(expires_in - TOKEN_EXPIRY_MARGIN, 0)
+            return self._token
+
+    async def _request(self, method: str, path: str, json: Optional[Dict] = None) -> Dict:
+        with span(f"paypal {method}", "client", {"http.request.method": method, "url.path": path}):
+            return await self.breaker.call(
+                lambda: self.bulkhead.call(lambda: self._send(method, path, json)),
+                is_failure=is_provider_failure
+            )
+
+    async def _send(self, method: str, path: str, json: Optional[Dict] = None) -> Dict:
+        token = await self._get_token()
+        for attempt in range(2):
+            try:
+                response = await self.client.request(
+                    method,
+                    path,
+                    json=json,
+                    headers={"Authorization": f"Bearer {token}"}
+                )
+            except httpx.TimeoutException as e:
+                raise PayPalTimeout(f"PayPal {method} {path} timed out: {e}")
+            except httpx.HTTPError as e:
+                raise PayPalError(f"PayPal {method} {path} failed: {e}")
+
+            # Token revoked or expired early: refresh once and retry
+            if response.status_code == 401 and attempt == 0:
+                token = await self._get_token(force_refresh=True)
+                continue
+            break
+
+        if response.status_code >= 400:
+            raise PayPalError(f"PayPal {method} {path} returned {response.status_code}",
+                              response.status_code, _json(response))
+        return response.json()
+
+    async def create_payment(self, payment: Dict) -> Dict:
+        """Create a payment and return PayPal's payment resource (with approval links)"""
+        return await self._request("POST", "/v1/payments/payment", payment)
+
+    async def find_payment(self, payment_id: str) -> Dict:
+        return await self._request("GET", f"/v1/payments/payment/{payment_id}")
+
+    async def execute_payment(self, payment_id: str, payer_id: str) -> Dict:
+        """Execute an approved payment"""
+        return await self._request(
+            "POST", f"/v1/payments/payment/{payment_id}/execute", {"payer_id": payer_id}
+        )
+
+    async def verify_webhook_signature(self, webhook_id: str, headers: Dict[str, str], event: Dict) -> bool:
+        """Ask PayPal whether a webhook delivery is authentic"""
+        result = await self._request("POST", "/v1/notifications/verify-webhook-signature", {
+            "auth_algo": headers.get("paypal-auth-algo"),
+            "cert_url": headers.get("paypal-cert-url"),
+            "transmission_id": headers.get("paypal-transmission-id"),
+            "transmission_sig": headers.get("paypal-transmission-sig"),
+            "transmission_time": headers.get("paypal-transmission-time"),
+            "webhook_id": webhook_id,
+            "webhook_event": event
+        })
+        return result.get("verification_status") == "SUCCESS"
+
+    def stats(self) -> Dict:
+        return {"circuitBreaker": self.breaker.stats(), "bulkhead": self.bulkhead.stats()}
+
+def _json(response: httpx.Response) -> Dict:
+    try:
+        return response.json()
+    except ValueError:
+        return {"body": response.text[:500]}
+
+paypal_gateway = PayPalGateway.from_env()
+
+def get_paypal_gateway() -> PayPalGateway:
+    return paypal_gateway
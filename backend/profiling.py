@@ -0,0 +1,139 @@
+"""
+On-demand profiling of a live worker.
+
+``sample_stacks`` runs a sampling profiler in a background thread: every
+``interval`` it records the Python stack of every other thread, and returns
+the samples in collapsed-stack format (``frame;frame;frame count``) that
+flamegraph.pl, speedscope and inferno read directly.
+
+The tracemalloc helpers keep a baseline snapshot and report the allocation
+sites that grew since then, for live memory growth (caches, bulk import).
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_PROFILE_SECONDS = 60
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# One profile at a time; overlapping samplers would skew each other
+_profile_lock = threading.Lock()
+
+class ProfileInProgress(Exception):
+    pass
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(BACKEND_DIR):
+        filename = os.path.relpath(filename, BACKEND_DIR)
+    else:
+        filename = filename.rsplit("site-packages" + os.sep, 1)[-1]
+    # ";" separates frames and the last space separates the count
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+def _collapse(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+def _sample(seconds: float, interval: float) -> Counter:
+    me = threading.get_ident()
+    names = {}
+    samples = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            if thread_id not in names:
+                names.update({thread.ident: thread.name.replace(" ", "_") for thread in threading.enumerate()})
+            name = names.get(thread_id, str(thread_id))
+            samples[f"{name};{_collapse(frame)}"] += 1
+        time.sleep(interval)
+    return samples
+
+async def sample_stacks(seconds: float, interval: float) -> str:
+    """Sample every thread for ``seconds``; returns collapsed stacks, heaviest first"""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfileInProgress("A profile is already running")
+    seconds = min(seconds, MAX_PROFILE_SECONDS)
+    try:
+        loop = asyncio.get_running_loop()
+        samples = await loop.run_in_executor(None, _sample, seconds, interval)
+    finally:
+        _profile_lock.release()
+    logger.info(f"Collected {sum(samples.values())} stack samples over {seconds}s")
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+# Allocation tracking
+
+_baseline: Optional[tracemalloc.Snapshot] = None
+
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>")
+]
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+async def start_allocation_tracking(frames: int) -> Dict:
+    """Start tracemalloc (if needed) and take the baseline snapshot"""
+    global _baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    loop = asyncio.get_running_loop()
+    _baseline = await loop.run_in_executor(None, _snapshot)
+    return allocation_status()
+
+def stop_allocation_tracking():
+    global _baseline
+    _baseline = None
+    tracemalloc.stop()
+
+def allocation_status() -> Dict:
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": tracemalloc.is_tracing(),
+        "frames": tracemalloc.get_traceback_limit(),
+        "tracedBytes": current,
+        "peakTracedBytes": peak,
+        "overheadBytes": tracemalloc.get_tracemalloc_memory(),
+        "hasBaseline": _baseline is not None
+    }
+
+def _compare(baseline: tracemalloc.Snapshot, group_by: str, limit: int) -> list:
+    stats = _snapshot().compare_to(baseline, group_by)
+    return [
+        {
+            "sizeDiff": stat.size_diff,
+            "size": stat.size,
+            "countDiff": stat.count_diff,
+            "count": stat.count,
+            "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+        }
+        for stat in stats[:limit]
+    ]
+
+async def allocation_diff(group_by: str, limit: int, reset_baseline: bool) -> Dict:
+    """Top allocation sites by growth since the baseline; raises RuntimeError when not tracing"""
+    global _baseline
+    if not tracemalloc.is_tracing() or _baseline is None:
+        raise RuntimeError("Allocation tracking is not running")
+    loop = asyncio.get_running_loop()
+    top = await loop.run_in_executor(None, _compare, _baseline, group_by, limit)
+    if reset_baseline:
+        _baseline = await loop.run_in_executor(None, _snapshot)
+    return {**allocation_status(), "groupBy": group_by, "top": top}
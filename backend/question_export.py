@@ -0,0 +1,132 @@
+import csv
+import io
+import json
+import tempfile
+from typing import AsyncIterator, Dict, Iterator
+import logging
+
+from fastapi.concurrency import run_in_threadpool
+from openpyxl import Workbook
+
+logger = logging.getLogger(__name__)
+
+# Same columns the bulk import reads, so a CSV export can be re-imported as-is
+EXPORT_COLUMNS = [
+    'topic_id', 'type', 'question_es', 'question_en', 'options', 'options_en',
+    'correct_answer', 'explanation_es', 'explanation_en', 'difficulty'
+]
+# Extra columns for analytics formats
+ANALYTICS_COLUMNS = ['id'] + EXPORT_COLUMNS + ['created_at']
+
+EXPORT_PROJECTION = {
+    "topicId": 1, "type": 1, "question": 1, "options": 1, "correctAnswer": 1,
+    "explanation": 1, "difficulty": 1, "createdAt": 1
+}
+
+CURSOR_BATCH_SIZE = 500
+CSV_CHUNK_SIZE = 64 * 1024
+PARQUET_ROW_GROUP_SIZE = 5000
+# Finished XLSX/Parquet files spill to disk above this size
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+def question_row(doc: Dict) -> Dict:
+    """Flatten a canonical question document into bulk-import columns"""
+    options = doc.get("options") or {}
+    correct_answer = doc.get("correctAnswer", 0)
+    if isinstance(correct_answer, bool):
+        # True/false options are [True, False], so True is index 0
+        correct_answer = 0 if correct_answer else 1
+
+    question = doc.get("question") or {}
+    explanation = doc.get("explanation") or {}
+    return {
+        'id': str(doc.get("_id", "")),
+        'topic_id': doc.get("topicId"),
+        'type': doc.get("type"),
+        'question_es': question.get("es", ""),
+        'question_en': question.get("en", ""),
+        'options': json.dumps(options.get("es", []), ensure_ascii=False),
+        'options_en': json.dumps(options.get("en", []), ensure_ascii=False),
+        'correct_answer': int(correct_answer),
+        'explanation_es': explanation.get("es", ""),
+        'explanation_en': explanation.get("en", ""),
+        'difficulty': doc.get("difficulty"),
+        'created_at': doc.get("createdAt")
+    }
+
+async def iter_csv(cursor) -> AsyncIterator[str]:
+    """Stream CSV text in chunks as documents arrive from the cursor"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    async for doc in cursor:
+        row = question_row(doc)
+        writer.writerow([row[column] for column in EXPORT_COLUMNS])
+        if buffer.tell() >= CSV_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue()
+
+def iter_file(file, chunk_size: int = CSV_CHUNK_SIZE) -> Iterator[bytes]:
+    """Read a finished export file in chunks and close it afterwards"""
+    try:
+        file.seek(0)
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file.close()
+
+async def build_xlsx(cursor):
+    """Write questions to a write-only workbook, returned as a spooled temp file"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("questions")
+    sheet.append(EXPORT_COLUMNS)
+
+    async for doc in cursor:
+        row = question_row(doc)
+        sheet.append([row[column] for column in EXPORT_COLUMNS])
+
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    await run_in_threadpool(workbook.save, output)
+    return output
+
+async def build_parquet(cursor):
+    """Write questions as Parquet row groups, returned as a spooled temp file"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('id', pa.string()),
+        ('topic_id', pa.int32()),
+        ('type', pa.string()),
+        ('question_es', pa.string()),
+        ('question_en', pa.string()),
+        ('options', pa.string()),
+        ('options_en', pa.string()),
+        ('correct_answer', pa.int32()),
+        ('explanation_es', pa.string()),
+        ('explanation_en', pa.string()),
+        ('difficulty', pa.string()),
+        ('created_at', pa.timestamp('ms'))
+    ])
+
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    writer = pq.ParquetWriter(output, schema, compression="zstd")
+    rows = []
+    try:
+        async for doc in cursor:
+            rows.append(question_row(doc))
+            if len(rows) >= PARQUET_ROW_GROUP_SIZE:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                rows = []
+        if rows:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+    finally:
+        writer.close()
+    return output
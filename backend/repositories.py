@@ -0,0 +1,296 @@
+"""
+Collection repositories.
+
+Each repository owns the query shapes, projections, hints and indexes of one
+collection, so routers never build raw filters against ``db[...]`` and never
+pull whole documents they do not need. Repositories are cheap to construct;
+build one per request from ``get_database()`` or ``get_read_database()``.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+from bson import ObjectId
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo import ASCENDING, DESCENDING, IndexModel
+import logging
+
+from database import (
+    get_database, USERS_COLLECTION, QUESTIONS_COLLECTION, EXAM_SESSIONS_COLLECTION,
+    EXAM_RESULTS_COLLECTION, SUBSCRIPTIONS_COLLECTION, PAYMENTS_COLLECTION,
+    PAYPAL_EVENTS_COLLECTION, CLEANUP_JOBS_COLLECTION
+)
+from models import SubscriptionStatus
+from dedup import SIGNATURE_PROJECTION
+from question_export import EXPORT_PROJECTION, CURSOR_BATCH_SIZE
+from payment_history import payment_page_query
+
+logger = logging.getLogger(__name__)
+
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+def to_api(doc: Optional[Dict]) -> Optional[Dict]:
+    """Copy of a document with _id exposed as a string "id" (unlike serialize_doc, never mutates)"""
+    if doc is None:
+        return None
+    result = {key: value for key, value in doc.items() if key != "_id"}
+    if "_id" in doc:
+        result["id"] = str(doc["_id"])
+    return result
+
+class Repository:
+    """Base repository for one collection.
+
+    ``raw=True`` decodes results as RawBSONDocument, for pass-through reads
+    that forward documents without touching most of their fields.
+    """
+
+    collection_name: str = ""
+    indexes: List[IndexModel] = []
+    # Names of indexes this collection used to have, dropped on startup
+    retired_indexes: List[str] = []
+
+    def __init__(self, db, raw: bool = False):
+        self.db = db
+        if raw:
+            self.collection = db.get_collection(self.collection_name, codec_options=RAW_CODEC_OPTIONS)
+        else:
+            self.collection = db[self.collection_name]
+
+    async def create_indexes(self):
+        if self.retired_indexes:
+            existing = await self.collection.index_information()
+            for name in self.retired_indexes:
+                if name in existing:
+                    await self.collection.drop_index(name)
+                    logger.info(f"Dropped retired index {name} on {self.collection_name}")
+        if self.indexes:
+            await self.collection.create_indexes(self.indexes)
+
+class UsersRepository(Repository):
+    collection_name = USERS_COLLECTION
+    indexes = [
+        IndexModel("username", unique=True),
+        IndexModel("email", unique=True),
+        IndexModel([("entitlement.status", ASCENDING), ("entitlement.expiresAt", ASCENDING)])
+    ]
+
+    # The authenticated principal: everything but the password hash
+    PRINCIPAL_PROJECTION = {"password": 0}
+
+    async def get_principal(self, username: str) -> Optional[Dict]:
+        return to_api(await self.collection.find_one({"username": username}, self.PRINCIPAL_PROJECTION))
+
+    async def get_credentials(self, username: str) -> Optional[Dict]:
+        """Full user document including the password hash, for login only"""
+        return to_api(await self.collection.find_one({"username": username}))
+
+    async def find_conflict(self, username: str, email: str) -> Optional[Dict]:
+        """A user already holding the username or email, in one query"""
+        return await self.collection.find_one(
+            {"$or": [{"username": username}, {"email": email}]},
+            {"_id": 0, "username": 1, "email": 1}
+        )
+
+    async def insert(self, user: Dict) -> str:
+        result = await self.collection.insert_one(user)
+        return str(result.inserted_id)
+
+    async def record_exam_progress(self, user_id: str, questions_added: int, average_score: Optional[float],
+                                   topic_key: Optional[str] = None, topic_score: int = 0, session=None):
+        """Apply one exam to progress in place, so concurrent submissions both count"""
+        update = {
+            "$inc": {"progress.completedQuestions": questions_added},
+            "$set": {"updatedAt": datetime.utcnow()}
+        }
+        if average_score is not None:
+            update["$set"]["progress.averageScore"] = average_score
+        if topic_key is not None:
+            # Keep the better score
+            update["$max"] = {f"progress.topicScores.{topic_key}": topic_score}
+        await self.collection.update_one({"_id": ObjectId(user_id)}, update, session=session)
+
+    async def set_language(self, username: str, language: str) -> bool:
+        result = await self.collection.update_one(
+            {"username": username},
+            {"$set": {"language": language, "updatedAt": datetime.utcnow()}}
+        )
+        return result.modified_count > 0
+
+class QuestionsRepository(Repository):
+    collection_name = QUESTIONS_COLLECTION
+    indexes = [
+        IndexModel("topicId"),
+        IndexModel("type"),
+        IndexModel("difficulty"),
+        IndexModel("lshBuckets")
+    ]
+
+    # Questions as served to students; MinHash signatures stay server-side
+    PUBLIC_PROJECTION = SIGNATURE_PROJECTION
+    # Only what grading a submitted answer needs
+    GRADING_PROJECTION = {"type": 1, "correctAnswer": 1, "explanation": 1}
+
+    async def find_public(self, query: Dict, limit: int) -> List[Dict]:
+        questions = await self.collection.find(query, self.PUBLIC_PROJECTION).limit(limit).to_list(length=limit)
+        return [to_api(question) for question in questions]
+
+    async def count(self, query: Dict) -> int:
+        return await self.collection.count_documents(query)
+
+    def export_cursor(self, query: Dict):
+        """Questions in _id order for the bulk export; build the repository with raw=True"""
+        return self.collection.find(query, EXPORT_PROJECTION).sort("_id", ASCENDING).batch_size(CURSOR_BATCH_SIZE)
+
+    async def sample(self, query: Dict, size: int) -> List[Dict]:
+        """Random questions; oversamples then trims for a better spread"""
+        pipeline = [{"$match": query}] if query else []
+        pipeline.extend([
+            {"$sample": {"size": size * 2}},
+            {"$limit": size},
+            {"$project": self.PUBLIC_PROJECTION}
+        ])
+        return await self.collection.aggregate(pipeline).to_list(length=size)
+
+    async def for_grading(self, question_ids: List[ObjectId]) -> Dict[str, Dict]:
+        """Grading fields keyed by question id"""
+        questions = await self.collection.find(
+            {"_id": {"$in": question_ids}}, self.GRADING_PROJECTION
+        ).to_list(length=len(question_ids))
+        return {str(question["_id"]): to_api(question) for question in questions}
+
+class ExamSessionsRepository(Repository):
+    collection_name = EXAM_SESSIONS_COLLECTION
+    indexes = [
+        IndexModel("examId"),
+        IndexModel("userId"),
+        IndexModel("startTime")
+    ]
+
+    SUBMIT_PROJECTION = {"questionIds": 1, "examType": 1, "topicId": 1, "startTime": 1, "duration": 1}
+
+    async def insert(self, session_data: Dict):
+        await self.collection.insert_one(session_data)
+
+    async def complete_open(self, exam_id: str, user_id: str, session=None) -> Optional[Dict]:
+        """Mark the user's open exam session completed and return it, or None"""
+        return await self.collection.find_one_and_update(
+            {"examId": exam_id, "userId": ObjectId(user_id), "isCompleted": False},
+            {"$set": {"isCompleted": True, "completedAt": datetime.utcnow()}},
+            projection=self.SUBMIT_PROJECTION,
+            session=session
+        )
+
+    async def reopen(self, exam_id: str, user_id: str, session=None):
+        """Undo complete_open when the submission could not be saved, so it can be retried"""
+        await self.collection.update_one(
+            {"examId": exam_id, "userId": ObjectId(user_id), "isCompleted": True},
+            {"$set": {"isCompleted": False}, "$unset": {"completedAt": ""}},
+            session=session
+        )
+
+class ExamResultsRepository(Repository):
+    collection_name = EXAM_RESULTS_COLLECTION
+    HISTORY_INDEX = [("userId", ASCENDING), ("completedAt", DESCENDING)]
+    indexes = [
+        IndexModel(HISTORY_INDEX),
+        IndexModel("examType"),
+        IndexModel("completedAt")
+    ]
+    # The single userId index is a prefix of HISTORY_INDEX and only costs writes
+    retired_indexes = ["userId_1"]
+
+    HISTORY_PROJECTION = {
+        "examType": 1, "topicId": 1, "score": 1, "correctAnswers": 1,
+        "totalQuestions": 1, "timeSpent": 1, "completedAt": 1
+    }
+
+    async def insert(self, result: Dict, session=None):
+        await self.collection.insert_one(result, session=session)
+
+    async def history(self, user_id: str, limit: int, session=None) -> List[Dict]:
+        results = await self.collection.find(
+            {"userId": ObjectId(user_id)}, self.HISTORY_PROJECTION, session=session
+        ).sort("completedAt", DESCENDING).hint(self.HISTORY_INDEX).limit(limit).to_list(length=limit)
+        return [to_api(result) for result in results]
+
+    async def count_for_user(self, user_id: str, session=None) -> int:
+        return await self.collection.count_documents(
+            {"userId": ObjectId(user_id)}, session=session, hint=self.HISTORY_INDEX
+        )
+
+    async def recent_scores(self, user_id: str, limit: int, session=None) -> List[int]:
+        results = await self.collection.find(
+            {"userId": ObjectId(user_id)}, {"_id": 0, "score": 1}, session=session
+        ).sort("completedAt", DESCENDING).hint(self.HISTORY_INDEX).limit(limit).to_list(length=limit)
+        return [result["score"] for result in results]
+
+class SubscriptionsRepository(Repository):
+    collection_name = SUBSCRIPTIONS_COLLECTION
+    indexes = [
+        IndexModel("userId"),
+        IndexModel([("status", ASCENDING), ("endDate", ASCENDING)]),
+        IndexModel("trialStartDate"),
+        IndexModel("cancelledAt", sparse=True)
+    ]
+
+    async def get_for_user(self, user_id: str) -> Optional[Dict]:
+        return to_api(await self.collection.find_one({"userId": user_id}))
+
+    async def exists_for_user(self, user_id: str) -> bool:
+        return await self.collection.find_one({"userId": user_id}, {"_id": 1}) is not None
+
+    async def insert(self, subscription: Dict, session=None) -> str:
+        result = await self.collection.insert_one(subscription, session=session)
+        return str(result.inserted_id)
+
+    async def cancel(self, user_id: str, now: datetime, session=None) -> bool:
+        result = await self.collection.update_one(
+            {"userId": user_id},
+            {"$set": {"status": SubscriptionStatus.cancelled.value, "cancelledAt": now, "updatedAt": now}},
+            session=session
+        )
+        return result.matched_count > 0
+
+class PaymentsRepository(Repository):
+    collection_name = PAYMENTS_COLLECTION
+    HISTORY_INDEX = [("userId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)]
+    indexes = [
+        IndexModel(HISTORY_INDEX),
+        IndexModel("paypalOrderId"),
+        IndexModel([("status", ASCENDING), ("createdAt", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("completedAt", ASCENDING)])
+    ]
+
+    # Fields returned to the client; PayPal ids and subscription links stay server-side
+    HISTORY_PROJECTION = {"amount": 1, "currency": 1, "status": 1, "createdAt": 1}
+
+    async def insert(self, payment: Dict) -> str:
+        result = await self.collection.insert_one(payment)
+        return str(result.inserted_id)
+
+    async def history_page(self, user_id: str, before: Optional[str], limit: int) -> List[Dict]:
+        """One keyset page, newest first; raises ValueError for malformed cursors"""
+        payments = await self.collection.find(
+            payment_page_query(user_id, before), self.HISTORY_PROJECTION
+        ).sort([("createdAt", DESCENDING), ("_id", DESCENDING)]).hint(self.HISTORY_INDEX).limit(limit).to_list(length=limit)
+        return [to_api(payment) for payment in payments]
+
+REPOSITORIES = [
+    UsersRepository, QuestionsRepository, ExamSessionsRepository,
+    ExamResultsRepository, SubscriptionsRepository, PaymentsRepository
+]
+
+async def create_indexes():
+    """Create database indexes for better performance"""
+    db = await get_database()
+
+    for repository in REPOSITORIES:
+        await repository(db).create_indexes()
+
+    # PayPal webhook events collection indexes (_id is the PayPal event id)
+    await db[PAYPAL_EVENTS_COLLECTION].create_index([("status", 1), ("receivedAt", 1)])
+
+    # Cleanup jobs collection indexes
+    await db[CLEANUP_JOBS_COLLECTION].create_index("status")
+
+    logger.info("Database indexes created successfully")
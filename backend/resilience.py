@@ -0,0 +1,158 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Tuple, Type, TypeVar
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class ProviderUnavailable(Exception):
+    """A downstream provider call was rejected without being attempted"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class BulkheadFull(ProviderUnavailable):
+    pass
+
+class CircuitOpen(ProviderUnavailable):
+    pass
+
+class Bulkhead:
+    """Caps concurrent calls to a provider; callers wait briefly for a slot, then fail fast"""
+
+    def __init__(self, name: str, max_concurrent: int, max_wait: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    async def call(self, func: Callable[[], Awaitable[T]]) -> T:
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise BulkheadFull(f"{self.name} bulkhead is full", retry_after=1)
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            return await func()
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict:
+        return {
+            "maxConcurrent": self.max_concurrent,
+            "inFlight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected
+        }
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures; half-open probes after reset_timeout"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_timeout: float,
+        half_open_max_calls: int = 1,
+        failure_exceptions: Tuple[Type[BaseException], ...] = (Exception,)
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.failure_exceptions = failure_exceptions
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.counters = {"success": 0, "failure": 0, "rejected": 0}
+        self.transitions = {self.OPEN: 0, self.HALF_OPEN: 0, self.CLOSED: 0}
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        logger.warning(f"Circuit {self.name} {self.state} -> {state}")
+        self.state = state
+        self.transitions[state] += 1
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+        if state == self.HALF_OPEN:
+            self.half_open_calls = 0
+        if state == self.CLOSED:
+            self.consecutive_failures = 0
+
+    def retry_after(self) -> float:
+        return max(self.reset_timeout - (time.monotonic() - self.opened_at), 0)
+
+    def _before_call(self):
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.counters["rejected"] += 1
+                raise CircuitOpen(f"{self.name} circuit is open", retry_after=self.retry_after())
+            self._transition(self.HALF_OPEN)
+
+        if self.state == self.HALF_OPEN:
+            if self.half_open_calls >= self.half_open_max_calls:
+                self.counters["rejected"] += 1
+                raise CircuitOpen(f"{self.name} circuit is half-open", retry_after=1)
+            self.half_open_calls += 1
+
+    def record_success(self):
+        self.counters["success"] += 1
+        self.consecutive_failures = 0
+        if self.state == self.HALF_OPEN:
+            self._transition(self.CLOSED)
+
+    def record_failure(self):
+        self.counters["failure"] += 1
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._transition(self.OPEN)
+
+    async def call(self, func: Callable[[], Awaitable[T]], is_failure: Callable[[BaseException], bool] = None) -> T:
+        self._before_call()
+        try:
+            result = await func()
+        except self.failure_exceptions as e:
+            if isinstance(e, ProviderUnavailable):
+                # Rejected before reaching the provider; free any probe slot
+                if self.state == self.HALF_OPEN:
+                    self.half_open_calls -= 1
+            elif is_failure is None or is_failure(e):
+                self.record_failure()
+            else:
+                # The provider answered (e.g. a 4xx), so it is healthy
+                self.record_success()
+            raise
+        except BaseException:
+            # Cancelled: free the probe slot so half-open cannot get stuck
+            if self.state == self.HALF_OPEN:
+                self.half_open_calls -= 1
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutiveFailures": self.consecutive_failures,
+            "retryAfter": round(self.retry_after(), 1) if self.state == self.OPEN else 0,
+            "calls": dict(self.counters),
+            "transitions": dict(self.transitions)
+        }
@@ -0,0 +1,184 @@
+import asyncio
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
+import os
+from pymongo import UpdateMany, UpdateOne
+import logging
+
+from database import (
+    get_database, SUBSCRIPTIONS_COLLECTION, PAYMENTS_COLLECTION, REVENUE_ROLLUPS_COLLECTION
+)
+from models import PaymentStatus, SubscriptionStatus
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_INTERVAL_SECONDS = float(os.getenv("REVENUE_ROLLUP_INTERVAL_SECONDS", "900"))
+# Monthly plan price, matching the amount charged by create-payment
+MONTHLY_PRICE = 10.0
+
+BUCKET_FIELDS = ["newTrials", "conversions", "cancellations", "payments", "revenue"]
+
+_tasks: List[asyncio.Task] = []
+
+def _day_key(day: date) -> str:
+    return day.isoformat()
+
+def _day_group(field: str) -> Dict:
+    return {"$dateToString": {"format": "%Y-%m-%d", "date": f"${field}"}}
+
+async def _counts_by_day(collection, match: Dict, field: str, accumulators: Dict) -> Dict[str, Dict]:
+    rows = await collection.aggregate([
+        {"$match": match},
+        {"$group": {"_id": _day_group(field), **accumulators}}
+    ]).to_list(length=None)
+    return {row.pop("_id"): row for row in rows}
+
+async def _first_activity_day(db) -> Optional[date]:
+    first = await db[SUBSCRIPTIONS_COLLECTION].find_one(
+        {"trialStartDate": {"$ne": None}}, {"trialStartDate": 1}, sort=[("trialStartDate", 1)]
+    )
+    return first["trialStartDate"].date() if first else None
+
+async def _resume_day(db) -> Optional[date]:
+    """Day to resume from: the newest bucket (it may be partial), else the first activity"""
+    latest = await db[REVENUE_ROLLUPS_COLLECTION].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    if latest:
+        return date.fromisoformat(latest["_id"])
+    return await _first_activity_day(db)
+
+async def update_revenue_rollups(db, since: Optional[date] = None, now: Optional[datetime] = None) -> int:
+    """Recompute daily buckets from ``since`` (default: the newest bucket) through today.
+
+    Each run only scans source documents newer than the start day, so the job
+    is incremental; overwriting whole days keeps it idempotent across workers.
+    """
+    now = now or datetime.utcnow()
+    since = since or await _resume_day(db)
+    if since is None:
+        return 0
+    start = datetime.combine(since, time.min)
+
+    trials = await _counts_by_day(
+        db[SUBSCRIPTIONS_COLLECTION], {"trialStartDate": {"$gte": start}},
+        "trialStartDate", {"newTrials": {"$sum": 1}}
+    )
+    cancellations = await _counts_by_day(
+        db[SUBSCRIPTIONS_COLLECTION], {"cancelledAt": {"$gte": start}},
+        "cancelledAt", {"cancellations": {"$sum": 1}}
+    )
+    payments = await _counts_by_day(
+        db[PAYMENTS_COLLECTION],
+        {"status": PaymentStatus.completed.value, "completedAt": {"$gte": start}},
+        "completedAt",
+        {
+            "payments": {"$sum": 1},
+            "revenue": {"$sum": "$amount"},
+            "conversions": {"$sum": {"$cond": ["$conversion", 1, 0]}}
+        }
+    )
+    # Point-in-time snapshot, recorded on today's bucket only
+    active = await db[SUBSCRIPTIONS_COLLECTION].count_documents({
+        "status": SubscriptionStatus.active.value, "endDate": {"$gt": now}
+    })
+
+    operations = []
+    today = now.date()
+    day = since
+    while day <= today:
+        key = _day_key(day)
+        bucket = {"date": datetime.combine(day, time.min), "updatedAt": now}
+        for source in (trials, cancellations, payments):
+            bucket.update(source.get(key, {}))
+        for field in BUCKET_FIELDS:
+            bucket.setdefault(field, 0)
+        bucket["revenue"] = round(bucket["revenue"], 2)
+        if day == today:
+            bucket["activeSubscriptions"] = active
+            bucket["mrr"] = round(active * MONTHLY_PRICE, 2)
+        # $set keeps the snapshot previously recorded on past days
+        operations.append(UpdateOne({"_id": key}, {"$set": bucket}, upsert=True))
+        day += timedelta(days=1)
+
+    if operations:
+        await db[REVENUE_ROLLUPS_COLLECTION].bulk_write(operations, ordered=False)
+    return len(operations)
+
+async def backfill_conversions(db, payments: List[Dict]):
+    """Flag each user's first completed payment as their trial -> paid conversion.
+
+    For payments completed before the flag was recorded at completion time;
+    payments that already carry it are left alone.
+    """
+    completed = PaymentStatus.completed.value
+    user_ids = list({
+        payment["userId"] for payment in payments
+        if payment.get("status") == completed and "conversion" not in payment and payment.get("userId")
+    })
+    if not user_ids:
+        return
+
+    firsts = await db[PAYMENTS_COLLECTION].aggregate([
+        {"$match": {"userId": {"$in": user_ids}, "status": completed}},
+        {"$sort": {"completedAt": 1, "_id": 1}},
+        {"$group": {
+            "_id": "$userId",
+            "paymentId": {"$first": "$_id"},
+            "completedAt": {"$first": "$completedAt"},
+            # A user whose conversion was already recorded needs no other one
+            "converted": {"$max": "$conversion"}
+        }}
+    ]).to_list(length=None)
+    conversions = [row for row in firsts if not row.get("converted")]
+    first_ids = [row["paymentId"] for row in conversions]
+
+    unflagged = {"userId": {"$in": user_ids}, "status": completed, "conversion": {"$exists": False}}
+    await db[PAYMENTS_COLLECTION].bulk_write([
+        UpdateMany({**unflagged, "_id": {"$in": first_ids}}, {"$set": {"conversion": True}}),
+        UpdateMany({**unflagged, "_id": {"$nin": first_ids}}, {"$set": {"conversion": False}})
+    ])
+
+    # Buckets built before the backfill counted these payments as no conversion
+    days = [row["completedAt"] for row in conversions if row.get("completedAt")]
+    if days and await db[REVENUE_ROLLUPS_COLLECTION].find_one({}, {"_id": 1}):
+        await update_revenue_rollups(db, since=min(days).date())
+
+async def revenue_series(db, days: int, now: Optional[datetime] = None) -> Dict:
+    """Daily buckets for the last ``days`` days plus totals, read from the rollups only"""
+    today = (now or datetime.utcnow()).date()
+    first = _day_key(today - timedelta(days=days - 1))
+    buckets = await db[REVENUE_ROLLUPS_COLLECTION].find(
+        {"_id": {"$gte": first}}, {"updatedAt": 0}
+    ).sort("_id", 1).to_list(length=days)
+
+    totals = {field: sum(bucket.get(field, 0) for bucket in buckets) for field in BUCKET_FIELDS}
+    totals["revenue"] = round(totals["revenue"], 2)
+    latest = next((b for b in reversed(buckets) if "activeSubscriptions" in b), None)
+
+    return {
+        "series": [{"day": bucket.pop("_id"), **bucket} for bucket in buckets],
+        "totals": totals,
+        "conversionRate": round(totals["conversions"] / totals["newTrials"], 4) if totals["newTrials"] else None,
+        "activeSubscriptions": latest["activeSubscriptions"] if latest else None,
+        "mrr": latest["mrr"] if latest else None
+    }
+
+async def _rollup_loop():
+    while True:
+        try:
+            db = await get_database()
+            await update_revenue_rollups(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Revenue rollup error: {e}")
+        await asyncio.sleep(ROLLUP_INTERVAL_SECONDS)
+
+def start_rollup_job():
+    """Start the periodic revenue rollup"""
+    _tasks.append(asyncio.create_task(_rollup_loop()))
+
+async def stop_rollup_job():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
@@ -1,11 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from typing import List
 import pandas as pd
 import io
 import json
-import uuid
 from bson import ObjectId
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
 import logging
 import os
 from pathlib import Path
@@ -13,14 +14,34 @@ from dotenv import load_dotenv
 
 from models import (
     AdminLogin, AdminResponse, UserCreate, UserResponse, QuestionCreate, 
-    QuestionResponse, QuestionsResponse, MessageResponse, UserRole
+    QuestionResponse, QuestionsResponse, MessageResponse, UserRole, ExportFormat,
+    SubscriptionStatus
 )
-from auth import get_password_hash
+from auth import get_password_hash, hash_passwords
 from database import (
-    get_database, USERS_COLLECTION, QUESTIONS_COLLECTION, 
-    serialize_doc, serialize_docs
+    get_database, USERS_COLLECTION, QUESTIONS_COLLECTION, SUBSCRIPTIONS_COLLECTION,
+    EXAM_RESULTS_COLLECTION, CLEANUP_JOBS_COLLECTION, serialize_doc, serialize_docs, pool_stats,
+    get_read_database
 )
-from datetime import datetime
+from subscription_state import subscription_response
+from repositories import QuestionsRepository
+from question_export import iter_csv, iter_file, build_xlsx, build_parquet
+from migrations import canonical_question, normalize_question_type
+from dedup import (
+    signature_fields, find_near_duplicates, near_duplicate_report, BatchDuplicateIndex
+)
+from cache import create_cache
+from db_monitoring import command_metrics, db_budget
+from loop_watchdog import loop_watchdog
+from profiling import (
+    MAX_PROFILE_SECONDS, ProfileInProgress, sample_stacks,
+    start_allocation_tracking, stop_allocation_tracking, allocation_status, allocation_diff
+)
+from paypal_gateway import get_paypal_gateway
+from cleanup import create_cleanup_job, schedule_cleanup_job, sweep_orphans
+from subscription_expiry import expire_lapsed_subscriptions
+from revenue_rollups import update_revenue_rollups, revenue_series
+from datetime import date, datetime, timedelta
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent.parent
@@ -29,6 +50,40 @@ load_dotenv(ROOT_DIR / '.env')
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Admin question listing: Spanish options as a list and true/false answers as
+# option indexes (0 = True), which is what the admin frontend renders
+ADMIN_QUESTION_PROJECTION = {
+    "_id": 0,
+    "id": {"$toString": "$_id"},
+    "topicId": 1,
+    "type": 1,
+    "question": 1,
+    "options": "$options.es",
+    "correctAnswer": {
+        "$cond": [
+            {"$eq": [{"$type": "$correctAnswer"}, "bool"]},
+            {"$cond": ["$correctAnswer", 0, 1]},
+            "$correctAnswer"
+        ]
+    },
+    "explanation": 1,
+    "difficulty": 1,
+    "createdAt": 1
+}
+
+TOPIC_COUNT = 10
+STATS_EXAM_DAYS = 30
+
+# Dashboard stats: fresh for 30s, then served stale while one refresh runs
+stats_cache = create_cache(
+    "admin_stats",
+    ttl=float(os.getenv("ADMIN_STATS_TTL_SECONDS", "30")),
+    stale_ttl=float(os.getenv("ADMIN_STATS_STALE_SECONDS", "300")),
+    max_entries=1
+)
+
+BULK_USER_IMPORT_MAX = int(os.getenv("BULK_USER_IMPORT_MAX", "10000"))
+
 # Admin password from environment variable
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
 
@@ -44,6 +99,26 @@ async def get_admin_access(admin_password: str):
             detail="Invalid admin password"
         )
 
+def new_user_document(user_data: UserCreate, hashed_password: str) -> dict:
+    """Build the stored document for a user created by an admin"""
+    now = datetime.utcnow()
+    return {
+        "username": user_data.username,
+        "email": user_data.email,
+        "password": hashed_password,
+        "name": user_data.name,
+        "language": user_data.language,
+        "role": UserRole.student,  # Default role
+        "progress": {
+            "completedQuestions": 0,
+            "totalQuestions": 100,
+            "averageScore": 0.0,
+            "topicScores": {}
+        },
+        "createdAt": now,
+        "updatedAt": now
+    }
+
 # Admin Authentication Endpoints
 @router.post("/login", response_model=AdminResponse)
 async def admin_login(admin_data: AdminLogin):
@@ -58,28 +133,77 @@ async def admin_login(admin_data: AdminLogin):
     return AdminResponse()
 
 # User Management Endpoints
+def user_listing_pipeline(after: str = None, limit: int = None) -> list:
+    """Users without password hashes, each joined with its subscription in one $lookup"""
+    pipeline = []
+    if after:
+        pipeline.append({"$match": {"_id": {"$gt": ObjectId(after)}}})
+    pipeline.append({"$sort": {"_id": 1}})
+    if limit:
+        pipeline.append({"$limit": limit})
+    pipeline.extend([
+        {"$project": {"password": 0}},
+        # Subscriptions reference users by the string form of _id
+        {"$addFields": {"id": {"$toString": "$_id"}}},
+        {"$lookup": {
+            "from": SUBSCRIPTIONS_COLLECTION,
+            "localField": "id",
+            "foreignField": "userId",
+            "as": "subscription"
+        }},
+        {"$addFields": {"subscription": {"$first": "$subscription"}}},
+        {"$project": {"_id": 0}}
+    ])
+    return pipeline
+
+def user_listing_response(user: dict) -> UserResponse:
+    """Convert a user_listing_pipeline document to UserResponse"""
+    subscription = user.pop("subscription", None)
+    if subscription:
+        user["subscription"] = subscription_response(serialize_doc(subscription))
+    return UserResponse(**user)
+
 @router.get("/users", response_model=List[UserResponse])
-async def get_all_users(admin_password: str):
-    """Get all users (admin only)"""
-    if not await verify_admin_password(admin_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid admin password"
-        )
+async def get_all_users(
+    admin_password: str,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    after: str = None
+):
+    """Get a page of users (admin only); the next page cursor is in X-Next-Cursor"""
+    await get_admin_access(admin_password)
+    
+    if after and not ObjectId.is_valid(after):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
     db = await get_database()
-    users_cursor = db[USERS_COLLECTION].find({})
-    users = await users_cursor.to_list(length=1000)
+    users = await db[USERS_COLLECTION].aggregate(
+        user_listing_pipeline(after, limit)
+    ).to_list(length=limit)
     
-    # Remove passwords from response
-    for user in users:
-        user.pop("password", None)
+    users_response = [user_listing_response(user) for user in users]
     
-    users_response = [UserResponse(**serialize_doc(user)) for user in users]
+    response.headers["X-Total-Count"] = str(await db[USERS_COLLECTION].estimated_document_count())
+    if len(users_response) == limit:
+        response.headers["X-Next-Cursor"] = users_response[-1].id
     
     logger.info(f"Retrieved {len(users_response)} users for admin")
     return users_response
 
+@router.get("/users/stream")
+async def stream_all_users(admin_password: str):
+    """Stream every user as NDJSON (admin only)"""
+    await get_admin_access(admin_password)
+    
+    db = await get_database()
+    
+    async def generate():
+        cursor = db[USERS_COLLECTION].aggregate(user_listing_pipeline(), batchSize=500)
+        async for user in cursor:
+            yield user_listing_response(user).model_dump_json() + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @router.post("/users", response_model=MessageResponse)
 async def create_user(user_data: UserCreate, admin_password: str):
     """Create new user (admin only)"""
@@ -109,28 +233,102 @@ async def create_user(user_data: UserCreate, admin_password: str):
     
     # Create user
     hashed_password = get_password_hash(user_data.password)
-    user_dict = {
-        "username": user_data.username,
-        "email": user_data.email,
-        "password": hashed_password,
-        "name": user_data.name,
-        "language": user_data.language,
-        "role": UserRole.student,  # Default role
-        "progress": {
-            "completedQuestions": 0,
-            "totalQuestions": 100,
-            "averageScore": 0.0,
-            "topicScores": {}
-        },
-        "createdAt": datetime.utcnow(),
-        "updatedAt": datetime.utcnow()
-    }
+    user_dict = new_user_document(user_data, hashed_password)
     
     result = await db[USERS_COLLECTION].insert_one(user_dict)
     logger.info(f"Admin created new user: {user_data.username}")
     
     return MessageResponse(message="User created successfully")
 
+@router.post("/users/bulk-import")
+async def bulk_import_users(
+    admin_password: str,
+    file: UploadFile = File(...)
+):
+    """Create users in bulk from a CSV or JSON file (admin only)"""
+    await get_admin_access(admin_password)
+    
+    filename = file.filename.lower()
+    if not (filename.endswith('.csv') or filename.endswith('.json')):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid file type. Please upload a CSV (.csv) or JSON (.json) file"
+        )
+    
+    contents = await file.read()
+    try:
+        if filename.endswith('.csv'):
+            df = pd.read_csv(io.StringIO(contents.decode('utf-8')), dtype=str, keep_default_na=False)
+            rows = df.to_dict(orient="records")
+        else:
+            rows = json.loads(contents.decode('utf-8'))
+            if not isinstance(rows, list):
+                raise ValueError("JSON file must contain a list of users")
+    except pd.errors.EmptyDataError:
+        raise HTTPException(status_code=400, detail="File is empty or invalid")
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
+    
+    if len(rows) > BULK_USER_IMPORT_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many users in one import (maximum {BULK_USER_IMPORT_MAX})"
+        )
+    
+    # Row numbers match the spreadsheet (header is row 1) for CSV, list index + 1 for JSON
+    row_offset = 2 if filename.endswith('.csv') else 1
+    results = []
+    valid_rows = []
+    for index, row in enumerate(rows):
+        try:
+            user_data = UserCreate(**{key: value for key, value in row.items() if value != ""})
+            valid_rows.append((index + row_offset, user_data))
+        except (ValidationError, TypeError, AttributeError) as e:
+            results.append({
+                "row": index + row_offset,
+                "username": row.get("username") if isinstance(row, dict) else None,
+                "status": "error",
+                "error": str(e)
+            })
+    
+    # Hash every password in parallel, then rely on the unique username/email
+    # indexes instead of per-row existence checks
+    hashed_passwords = await hash_passwords([user_data.password for _, user_data in valid_rows])
+    documents = [
+        new_user_document(user_data, hashed)
+        for (_, user_data), hashed in zip(valid_rows, hashed_passwords)
+    ]
+    
+    failed = {}
+    if documents:
+        db = await get_database()
+        try:
+            await db[USERS_COLLECTION].insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") == 11000:
+                    field = next(iter(error.get("keyValue") or {"username": None}))
+                    failed[error["index"]] = f"{field.capitalize()} already exists"
+                else:
+                    failed[error["index"]] = error.get("errmsg", "Insert failed")
+    
+    for index, (row_number, user_data) in enumerate(valid_rows):
+        if index in failed:
+            results.append({"row": row_number, "username": user_data.username, "status": "error", "error": failed[index]})
+        else:
+            results.append({"row": row_number, "username": user_data.username, "status": "created"})
+    results.sort(key=lambda result: result["row"])
+    
+    created_count = sum(1 for result in results if result["status"] == "created")
+    logger.info(f"Admin bulk imported {created_count} of {len(rows)} users")
+    
+    return {
+        "message": "Bulk user import completed",
+        "created_count": created_count,
+        "error_count": len(results) - created_count,
+        "results": results
+    }
+
 @router.delete("/users/{user_id}", response_model=MessageResponse)
 async def delete_user(user_id: str, admin_password: str):
     """Delete user (admin only)"""
@@ -159,9 +357,126 @@ async def delete_user(user_id: str, admin_password: str):
             detail="User not found"
         )
     
+    # Remove the user's exams, sessions, payments and subscription in the background
+    job_id = await create_cleanup_job(db, user_id)
+    schedule_cleanup_job(job_id)
+    
     logger.info(f"Admin deleted user: {user['username']}")
     return MessageResponse(message="User deleted successfully")
 
+@router.get("/analytics/revenue")
+async def get_revenue_analytics(admin_password: str, days: int = Query(90, ge=1, le=730)):
+    """Daily trials, conversions, cancellations and revenue from the rollups (admin only)"""
+    await get_admin_access(admin_password)
+    
+    db = await get_database()
+    return await revenue_series(db, days)
+
+@router.get("/payment-provider")
+async def get_payment_provider_state(admin_password: str):
+    """Circuit breaker and bulkhead state for PayPal calls (admin only)"""
+    await get_admin_access(admin_password)
+    return get_paypal_gateway().stats()
+
+@router.get("/database/pool")
+async def get_database_pool_state(admin_password: str):
+    """MongoDB connection pool metrics for the worker serving the request (admin only)"""
+    await get_admin_access(admin_password)
+    return pool_stats()
+
+@router.get("/database/queries")
+async def get_database_query_stats(admin_password: str, limit: int = Query(50, ge=1, le=500)):
+    """Command latency by route/collection/operation and the slowest recent queries (admin only)"""
+    await get_admin_access(admin_password)
+    return command_metrics.stats(limit)
+
+@router.delete("/database/queries", response_model=MessageResponse)
+async def reset_database_query_stats(admin_password: str):
+    """Clear command latency stats and the slow-query log (admin only)"""
+    await get_admin_access(admin_password)
+    command_metrics.reset()
+    return MessageResponse(message="Query stats reset")
+
+@router.get("/diagnostics/loop-blocks")
+async def get_loop_block_incidents(admin_password: str, limit: int = Query(20, ge=1, le=100)):
+    """Recent event loop stalls with the route and stack that caused them (admin only)"""
+    await get_admin_access(admin_password)
+    return loop_watchdog.stats(limit)
+
+@router.get("/diagnostics/profile")
+async def profile_worker(
+    admin_password: str,
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=1000)
+):
+    """Sample this worker's stacks for a while and download them as collapsed stacks for a flamegraph (admin only)"""
+    await get_admin_access(admin_password)
+    try:
+        collapsed = await sample_stacks(seconds, interval_ms / 1000)
+    except ProfileInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    filename = f"profile-{os.getpid()}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.collapsed"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    return PlainTextResponse(collapsed, headers=headers)
+
+@router.post("/diagnostics/allocations")
+async def start_allocation_snapshot(admin_password: str, frames: int = Query(10, ge=1, le=50)):
+    """Start tracemalloc and take the baseline snapshot later diffs compare against (admin only)"""
+    await get_admin_access(admin_password)
+    return await start_allocation_tracking(frames)
+
+@router.get("/diagnostics/allocations")
+async def get_allocation_diff(
+    admin_password: str,
+    limit: int = Query(25, ge=1, le=200),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    reset_baseline: bool = False
+):
+    """Allocation sites that grew the most since the baseline snapshot (admin only)"""
+    await get_admin_access(admin_password)
+    try:
+        return await allocation_diff(group_by, limit, reset_baseline)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.delete("/diagnostics/allocations")
+async def stop_allocation_snapshot(admin_password: str):
+    """Stop tracemalloc and drop the baseline; tracing slows allocation-heavy code (admin only)"""
+    await get_admin_access(admin_password)
+    stop_allocation_tracking()
+    return allocation_status()
+
+@router.post("/maintenance/orphan-sweep")
+async def sweep_orphaned_documents(admin_password: str):
+    """Schedule cleanup of documents that belong to users that no longer exist (admin only)"""
+    await get_admin_access(admin_password)
+    return await sweep_orphans()
+
+@router.post("/maintenance/expire-subscriptions")
+async def expire_subscriptions(admin_password: str):
+    """Run the subscription expiry sweep now (admin only)"""
+    await get_admin_access(admin_password)
+    
+    db = await get_database()
+    return {"expired": await expire_lapsed_subscriptions(db)}
+
+@router.post("/maintenance/revenue-rollups")
+async def rebuild_revenue_rollups(admin_password: str, since: date = None):
+    """Recompute revenue rollups from a day (default: the newest bucket) through today (admin only)"""
+    await get_admin_access(admin_password)
+    
+    db = await get_database()
+    return {"days": await update_revenue_rollups(db, since)}
+
+@router.get("/maintenance/cleanup-jobs")
+async def get_cleanup_jobs(admin_password: str, limit: int = Query(50, ge=1, le=500)):
+    """List the most recent cleanup jobs (admin only)"""
+    await get_admin_access(admin_password)
+    
+    db = await get_database()
+    jobs = await db[CLEANUP_JOBS_COLLECTION].find().sort("_id", -1).limit(limit).to_list(length=limit)
+    return serialize_docs(jobs)
+
 # Question Management Endpoints
 @router.get("/questions")
 async def get_all_questions(admin_password: str, topic_id: int = None):
@@ -179,54 +494,22 @@ async def get_all_questions(admin_password: str, topic_id: int = None):
     if topic_id:
         query["topicId"] = topic_id
     
-    questions_cursor = db[QUESTIONS_COLLECTION].find(query)
-    questions = await questions_cursor.to_list(length=1000)
+    # Documents are stored in the canonical schema (see migrations.py), so the
+    # frontend shape is a plain server-side projection
+    pipeline = [
+        {"$match": query},
+        {"$limit": 1000},
+        {"$project": ADMIN_QUESTION_PROJECTION}
+    ]
+    questions_response = await db[QUESTIONS_COLLECTION].aggregate(pipeline).to_list(length=1000)
     
     total = await db[QUESTIONS_COLLECTION].count_documents(query)
     
-    # Transform questions for frontend compatibility
-    questions_response = []
-    for q in questions:
-        # Handle options - convert dict to list if necessary
-        options = q.get("options", [])
-        if isinstance(options, dict):
-            # Use Spanish options as default, or English if Spanish not available
-            options = options.get("es", options.get("en", []))
-        
-        # Ensure question and explanation are dicts
-        question_text = q.get("question", {})
-        if not isinstance(question_text, dict):
-            question_text = {"es": str(question_text), "en": str(question_text)}
-        
-        explanation = q.get("explanation", {})
-        if not isinstance(explanation, dict):
-            explanation = {"es": str(explanation), "en": str(explanation)}
-        
-        # Normalize type
-        q_type = q.get("type", "multiple_choice")
-        if q_type == "multiple-choice":
-            q_type = "multiple_choice"
-        elif q_type == "true-false":
-            q_type = "true_false"
-        
-        question_data = {
-            "id": str(q.get("_id", "")),
-            "topicId": q.get("topicId", 1),
-            "type": q_type,
-            "question": question_text,
-            "options": options,
-            "correctAnswer": q.get("correctAnswer", 0),
-            "explanation": explanation,
-            "difficulty": q.get("difficulty", "medium"),
-            "createdAt": q.get("createdAt", datetime.utcnow())
-        }
-        questions_response.append(question_data)
-    
     logger.info(f"Retrieved {len(questions_response)} questions for admin")
     return {"questions": questions_response, "total": total}
 
 @router.post("/questions", response_model=MessageResponse)
-async def create_question(question_data: dict, admin_password: str):
+async def create_question(question_data: dict, admin_password: str, allow_duplicates: bool = False):
     """Create new question (admin only) - accepts flexible format from frontend"""
     if not await verify_admin_password(admin_password):
         raise HTTPException(
@@ -237,63 +520,27 @@ async def create_question(question_data: dict, admin_password: str):
     try:
         db = await get_database()
         
-        # Normalize type field (convert "multiple-choice" to "multiple_choice")
-        question_type = question_data.get("type", "multiple_choice")
-        if question_type == "multiple-choice":
-            question_type = "multiple_choice"
-        elif question_type == "true-false":
-            question_type = "true_false"
-        
-        # Handle question text - can be dict or MultilingualText object
-        question_text = question_data.get("question", {})
-        if isinstance(question_text, dict):
-            question_es = question_text.get("es", "")
-            question_en = question_text.get("en", "")
-        else:
-            question_es = str(question_text)
-            question_en = str(question_text)
-        
-        # Handle explanation - can be dict or MultilingualText object
-        explanation = question_data.get("explanation", {})
-        if isinstance(explanation, dict):
-            explanation_es = explanation.get("es", "")
-            explanation_en = explanation.get("en", "")
-        else:
-            explanation_es = str(explanation)
-            explanation_en = str(explanation)
-        
-        # Handle options - can be list or dict
-        options = question_data.get("options", [])
-        if isinstance(options, list):
-            # Convert list to dict format expected by the system
-            options_dict = {"es": options, "en": options}
-        elif isinstance(options, dict):
-            options_dict = options
-        else:
-            options_dict = {"es": [], "en": []}
-        
-        # Create question document
-        question_dict = {
-            "topicId": int(question_data.get("topicId", 1)),
-            "type": question_type,
-            "question": {"es": question_es, "en": question_en},
-            "correctAnswer": int(question_data.get("correctAnswer", 0)),
-            "explanation": {"es": explanation_es, "en": explanation_en},
-            "difficulty": question_data.get("difficulty", "medium"),
-            "createdAt": datetime.utcnow()
-        }
+        question_dict = canonical_question(question_data)
         
-        # Add options for multiple choice questions
-        if question_type == "multiple_choice" and options_dict:
-            question_dict["options"] = options_dict
-        elif question_type == "true_false":
-            question_dict["options"] = {"es": ["Verdadero", "Falso"], "en": ["True", "False"]}
+        # Reject lightly reworded copies of existing questions
+        question_dict.update(signature_fields(question_dict["question"]))
+        if not allow_duplicates:
+            duplicates = await find_near_duplicates(db, question_dict, limit=1)
+            if duplicates:
+                duplicate = duplicates[0]
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Question is a near-duplicate of question {duplicate['id']} "
+                           f"({duplicate['similarity']:.0%} similar)"
+                )
         
         result = await db[QUESTIONS_COLLECTION].insert_one(question_dict)
         logger.info(f"Admin created new question for topic {question_dict['topicId']}")
         
         return MessageResponse(message="Question created successfully")
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating question: {e}")
         raise HTTPException(
@@ -301,6 +548,56 @@ async def create_question(question_data: dict, admin_password: str):
             detail=f"Error creating question: {str(e)}"
         )
 
+@router.get("/questions/near-duplicates")
+async def get_near_duplicate_report(admin_password: str, threshold: float = None):
+    """Report clusters of near-duplicate questions (admin only)"""
+    await get_admin_access(admin_password)
+    
+    if threshold is not None and not (0 < threshold <= 1):
+        raise HTTPException(status_code=400, detail="Threshold must be between 0 and 1")
+    
+    db = await get_database()
+    report = await near_duplicate_report(db, threshold=threshold)
+    
+    logger.info(f"Near-duplicate report found {report['total']} clusters")
+    return report
+
+@router.get("/questions/export")
+async def export_questions(
+    admin_password: str,
+    export_format: ExportFormat = Query(ExportFormat.csv, alias="format"),
+    topic_id: int = None
+):
+    """Export the whole question bank as CSV, XLSX or Parquet (admin only)"""
+    await get_admin_access(admin_password)
+    
+    db = await get_database()
+    query = {"topicId": topic_id} if topic_id else {}
+    # Pass-through read: each question is decoded as its row is written, not a batch at a time
+    cursor = QuestionsRepository(db, raw=True).export_cursor(query)
+    
+    filename = f"questions_export.{export_format.value}"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    
+    if export_format == ExportFormat.csv:
+        return StreamingResponse(iter_csv(cursor), media_type="text/csv; charset=utf-8", headers=headers)
+    
+    if export_format == ExportFormat.xlsx:
+        output = await build_xlsx(cursor)
+        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        try:
+            output = await build_parquet(cursor)
+        except ImportError:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="Parquet export requires pyarrow to be installed"
+            )
+        media_type = "application/vnd.apache.parquet"
+    
+    logger.info(f"Exported questions as {export_format.value}")
+    return StreamingResponse(iter_file(output), media_type=media_type, headers=headers)
+
 @router.delete("/questions/{question_id}", response_model=MessageResponse)
 async def delete_question(question_id: str, admin_password: str):
     """Delete question (admin only)"""
@@ -332,31 +629,92 @@ async def delete_question(question_id: str, admin_password: str):
     logger.info(f"Admin deleted question: {question_id}")
     return MessageResponse(message="Question deleted successfully")
 
+async def compute_admin_stats(db) -> dict:
+    """Compute all dashboard statistics in a single aggregation round trip"""
+    now = datetime.utcnow()
+    since = now - timedelta(days=STATS_EXAM_DAYS)
+    
+    pipeline = [
+        {"$project": {"_id": 0, "kind": "user"}},
+        {"$unionWith": {"coll": QUESTIONS_COLLECTION, "pipeline": [
+            {"$project": {"_id": 0, "kind": "question", "topicId": 1, "difficulty": 1, "type": 1}}
+        ]}},
+        {"$unionWith": {"coll": SUBSCRIPTIONS_COLLECTION, "pipeline": [
+            {"$match": {
+                "status": {"$in": [SubscriptionStatus.trial.value, SubscriptionStatus.active.value]},
+                "endDate": {"$gt": now}
+            }},
+            {"$project": {"_id": 0, "kind": "subscription", "status": 1}}
+        ]}},
+        {"$unionWith": {"coll": EXAM_RESULTS_COLLECTION, "pipeline": [
+            {"$match": {"completedAt": {"$gte": since}}},
+            {"$project": {
+                "_id": 0,
+                "kind": "exam",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$completedAt"}}
+            }}
+        ]}},
+        {"$facet": {
+            "users": [{"$match": {"kind": "user"}}, {"$count": "count"}],
+            "questions": [{"$match": {"kind": "question"}}, {"$count": "count"}],
+            "questionsByTopic": [
+                {"$match": {"kind": "question"}},
+                {"$group": {"_id": "$topicId", "count": {"$sum": 1}}}
+            ],
+            "questionsByDifficulty": [
+                {"$match": {"kind": "question"}},
+                {"$group": {"_id": "$difficulty", "count": {"$sum": 1}}}
+            ],
+            "questionsByType": [
+                {"$match": {"kind": "question"}},
+                {"$group": {"_id": "$type", "count": {"$sum": 1}}}
+            ],
+            "activeSubscriptions": [
+                {"$match": {"kind": "subscription"}},
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+            ],
+            "examsPerDay": [
+                {"$match": {"kind": "exam"}},
+                {"$group": {"_id": "$day", "count": {"$sum": 1}}},
+                {"$sort": {"_id": 1}}
+            ]
+        }}
+    ]
+    
+    result = (await db[USERS_COLLECTION].aggregate(pipeline).to_list(length=1))[0]
+    
+    def total(facet):
+        return result[facet][0]["count"] if result[facet] else 0
+    
+    def counts(facet):
+        return {group["_id"]: group["count"] for group in result[facet] if group["_id"] is not None}
+    
+    # Numeric keys for frontend compatibility, every topic present
+    by_topic = counts("questionsByTopic")
+    questions_by_topic = {topic_id: by_topic.get(topic_id, 0) for topic_id in range(1, TOPIC_COUNT + 1)}
+    active_subscriptions = counts("activeSubscriptions")
+    
+    return {
+        "totalUsers": total("users"),
+        "totalQuestions": total("questions"),
+        "questionsByTopic": questions_by_topic,
+        "questionsByDifficulty": counts("questionsByDifficulty"),
+        "questionsByType": counts("questionsByType"),
+        "activeSubscriptions": sum(active_subscriptions.values()),
+        "activeSubscriptionsByStatus": active_subscriptions,
+        "examsPerDay": counts("examsPerDay"),
+        "generatedAt": now
+    }
+
 @router.get("/stats")
+@db_budget(1)
 async def get_admin_stats(admin_password: str):
-    """Get admin statistics"""
+    """Get admin statistics (cached, refreshed in the background when stale)"""
     await get_admin_access(admin_password)
     
     try:
-        db = await get_database()
-        
-        # Count users
-        user_count = await db[USERS_COLLECTION].count_documents({})
-        
-        # Count questions
-        question_count = await db[QUESTIONS_COLLECTION].count_documents({})
-        
-        # Count questions by topic - use numeric keys for frontend compatibility
-        questions_by_topic = {}
-        for topic_id in range(1, 6):
-            count = await db[QUESTIONS_COLLECTION].count_documents({"topicId": topic_id})
-            questions_by_topic[topic_id] = count
-        
-        return {
-            "totalUsers": user_count,
-            "totalQuestions": question_count,
-            "questionsByTopic": questions_by_topic
-        }
+        db = await get_read_database("admin_stats")
+        return await stats_cache.get("admin_stats", lambda: compute_admin_stats(db))
     
     except Exception as e:
         logger.error(f"Error getting admin stats: {e}")
@@ -365,7 +723,8 @@ async def get_admin_stats(admin_password: str):
 @router.post("/questions/bulk-import")
 async def bulk_import_questions(
     admin_password: str,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    allow_duplicates: bool = False
 ):
     """Import questions in bulk from Excel/CSV file"""
     await get_admin_access(admin_password)
@@ -411,6 +770,7 @@ async def bulk_import_questions(
         db = await get_database()
         imported_questions = []
         errors = []
+        batch_index = BatchDuplicateIndex()
         
         for index, row in df.iterrows():
             try:
@@ -423,16 +783,24 @@ async def bulk_import_questions(
                     # Comma-separated format
                     options = [opt.strip() for opt in options_str.split(',')]
                 
+                # Optional English options (written by the export endpoint)
+                options_value = options
+                if 'options_en' in df.columns and not pd.isna(row['options_en']):
+                    options_en = json.loads(str(row['options_en']))
+                    if len(options_en) != len(options):
+                        errors.append(f"Row {index + 2}: options and options_en must have the same length")
+                        continue
+                    options_value = {"es": options, "en": options_en}
+                
                 # Create question document
                 question_doc = {
-                    "id": str(uuid.uuid4()),
                     "topicId": int(row['topic_id']),
-                    "type": str(row['type']).lower().replace(' ', '_'),
+                    "type": normalize_question_type(row['type']),
                     "question": {
                         "es": str(row['question_es']).strip(),
                         "en": str(row['question_en']).strip()
                     },
-                    "options": options,
+                    "options": options_value,
                     "correctAnswer": int(row['correct_answer']),
                     "explanation": {
                         "es": str(row['explanation_es']).strip(),
@@ -444,8 +812,8 @@ async def bulk_import_questions(
                 }
                 
                 # Validate question
-                if not (1 <= question_doc["topicId"] <= 5):
-                    errors.append(f"Row {index + 2}: Topic ID must be between 1-5")
+                if not (1 <= question_doc["topicId"] <= 10):
+                    errors.append(f"Row {index + 2}: Topic ID must be between 1-10")
                     continue
                 
                 if question_doc["type"] not in ["multiple_choice", "true_false"]:
@@ -464,13 +832,34 @@ async def bulk_import_questions(
                     errors.append(f"Row {index + 2}: Correct answer index out of range")
                     continue
                 
+                question_doc = canonical_question(question_doc)
+                
+                # Check near-duplicates against the bank and earlier rows of this file
+                question_doc.update(signature_fields(question_doc["question"]))
+                if not allow_duplicates:
+                    batch_match = batch_index.match(question_doc)
+                    if batch_match:
+                        errors.append(
+                            f"Row {index + 2}: Near-duplicate of {batch_match[0]} ({batch_match[1]:.0%} similar)"
+                        )
+                        continue
+                    
+                    duplicates = await find_near_duplicates(db, question_doc, limit=1)
+                    if duplicates:
+                        errors.append(
+                            f"Row {index + 2}: Near-duplicate of question {duplicates[0]['id']} "
+                            f"({duplicates[0]['similarity']:.0%} similar)"
+                        )
+                        continue
+                batch_index.add(f"row {index + 2}", question_doc)
+                
                 # Insert into database
                 result = await db[QUESTIONS_COLLECTION].insert_one(question_doc)
                 
                 if result.inserted_id:
                     imported_questions.append({
                         "row": index + 2,
-                        "id": question_doc["id"],
+                        "id": str(result.inserted_id),
                         "topic": question_doc["topicId"],
                         "question_es": question_doc["question"]["es"][:50] + "..."
                     })
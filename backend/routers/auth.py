@@ -11,7 +11,8 @@ from auth import (
     get_password_hash,
     ACCESS_TOKEN_EXPIRE_HOURS
 )
-from database import get_database, USERS_COLLECTION, serialize_doc
+from database import get_database
+from repositories import UsersRepository
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -43,18 +44,16 @@ async def login(user_credentials: UserLogin):
 async def register(user_data: UserCreate):
     """Register new user"""
     db = await get_database()
+    users = UsersRepository(db)
     
-    # Check if username already exists
-    existing_user = await db[USERS_COLLECTION].find_one({"username": user_data.username})
-    if existing_user:
+    # Check if username or email already exists
+    existing_user = await users.find_conflict(user_data.username, user_data.email)
+    if existing_user and existing_user["username"] == user_data.username:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
-    
-    # Check if email already exists
-    existing_email = await db[USERS_COLLECTION].find_one({"email": user_data.email})
-    if existing_email:
+    if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
@@ -78,7 +77,7 @@ async def register(user_data: UserCreate):
         "updatedAt": datetime.utcnow()
     }
     
-    result = await db[USERS_COLLECTION].insert_one(user_dict)
+    await users.insert(user_dict)
     logger.info(f"New user registered: {user_data.username}")
     
     return MessageResponse(message="User registered successfully")
@@ -96,17 +95,8 @@ async def update_language(
     """Update user's language preference"""
     db = await get_database()
     
-    result = await db[USERS_COLLECTION].update_one(
-        {"username": current_user.username},
-        {
-            "$set": {
-                "language": language_data.language,
-                "updatedAt": datetime.utcnow()
-            }
-        }
-    )
-    
-    if result.modified_count == 0:
+    updated = await UsersRepository(db).set_language(current_user.username, language_data.language)
+    if not updated:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
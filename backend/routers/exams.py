@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List, Dict, Union
+from typing import List, Dict, Tuple, Union
 import uuid
 from datetime import datetime, timedelta
 from bson import ObjectId
@@ -11,9 +11,10 @@ from models import (
     QuestionResult, UserResponse, ExamType
 )
 from auth import get_current_user
-from database import (
-    get_database, QUESTIONS_COLLECTION, EXAM_RESULTS_COLLECTION, 
-    EXAM_SESSIONS_COLLECTION, USERS_COLLECTION, serialize_doc, serialize_docs
+from database import get_database, get_read_database, causal_write_session, causal_read_session
+from db_monitoring import db_budget
+from repositories import (
+    QuestionsRepository, ExamSessionsRepository, ExamResultsRepository, UsersRepository, to_api
 )
 
 logger = logging.getLogger(__name__)
@@ -53,17 +54,7 @@ async def start_exam(
         match_stage["topicId"] = exam_data.topicId
     
     # Get random questions
-    pipeline = []
-    if match_stage:
-        pipeline.append({"$match": match_stage})
-    
-    pipeline.extend([
-        {"$sample": {"size": config["questions"] * 2}},  # Get more for better randomization
-        {"$limit": config["questions"]}
-    ])
-    
-    questions_cursor = db[QUESTIONS_COLLECTION].aggregate(pipeline)
-    questions = await questions_cursor.to_list(length=config["questions"])
+    questions = await QuestionsRepository(db).sample(match_stage, config["questions"])
     
     if len(questions) < config["questions"]:
         logger.warning(f"Only found {len(questions)} questions, requested {config['questions']}")
@@ -89,15 +80,12 @@ async def start_exam(
         "createdAt": start_time
     }
     
-    await db[EXAM_SESSIONS_COLLECTION].insert_one(session_data)
+    await ExamSessionsRepository(db).insert(session_data)
     
     # Convert questions to response format
-    questions_response = [
-        QuestionResponse(**serialize_doc(q)) 
-        for q in questions
-    ]
+    questions_response = [QuestionResponse(**to_api(q)) for q in questions]
     
-    logger.info(f"Started {exam_data.examType} exam for user {current_user.username}")
+    logger.info("Started %s exam for user %s", exam_data.examType, current_user.username)
     
     return ExamStartResponse(
         examId=exam_id,
@@ -106,48 +94,14 @@ async def start_exam(
         duration=config["duration"]
     )
 
-@router.post("/submit", response_model=ExamSubmitResponse)
-async def submit_exam(
-    exam_data: ExamSubmit,
-    current_user: UserResponse = Depends(get_current_user)
-):
-    """Submit exam answers and calculate results"""
-    db = await get_database()
-    
-    # Get exam session
-    session = await db[EXAM_SESSIONS_COLLECTION].find_one({
-        "examId": exam_data.examId,
-        "userId": ObjectId(current_user.id),
-        "isCompleted": False
-    })
-    
-    if not session:
-        raise HTTPException(
-            status_code=404,
-            detail="Exam session not found or already completed"
-        )
-    
-    # Check if exam time has expired
-    elapsed_time = datetime.utcnow() - session["startTime"]
-    if elapsed_time.total_seconds() > session["duration"]:
-        logger.warning(f"Exam {exam_data.examId} submitted after time limit")
-    
-    # Get questions used in exam
-    question_ids = session["questionIds"]
-    questions_cursor = db[QUESTIONS_COLLECTION].find({"_id": {"$in": question_ids}})
-    questions = await questions_cursor.to_list(length=len(question_ids))
-    
-    # Create question lookup by ID for preserving order
-    question_lookup = {str(q["_id"]): serialize_doc(q) for q in questions}
-    ordered_questions = [question_lookup[str(qid)] for qid in question_ids if str(qid) in question_lookup]
-    
-    # Calculate results
+def grade_answers(questions: List[Dict], answers: Dict) -> Tuple[List[QuestionResult], int]:
+    """Per-question results and the number answered correctly"""
     results = []
     correct_count = 0
     
-    for i, question in enumerate(ordered_questions):
+    for i, question in enumerate(questions):
         question_index = str(i)
-        user_answer = exam_data.answers.get(question_index)
+        user_answer = answers.get(question_index)
         correct_answer = question["correctAnswer"]
         
         is_correct = False
@@ -179,37 +133,78 @@ async def submit_exam(
             explanation=question["explanation"]
         ))
     
-    # Calculate score
-    total_questions = len(ordered_questions)
-    score = round((correct_count / total_questions) * 100) if total_questions > 0 else 0
-    
-    # Save exam result
-    exam_result = {
-        "userId": ObjectId(current_user.id),
-        "examType": session["examType"],
-        "topicId": session.get("topicId"),
-        "score": score,
-        "correctAnswers": correct_count,
-        "totalQuestions": total_questions,
-        "timeSpent": exam_data.timeSpent,
-        "answers": exam_data.answers,
-        "questionIds": question_ids,
-        "completedAt": datetime.utcnow(),
-        "createdAt": datetime.utcnow()
-    }
-    
-    await db[EXAM_RESULTS_COLLECTION].insert_one(exam_result)
-    
-    # Mark session as completed
-    await db[EXAM_SESSIONS_COLLECTION].update_one(
-        {"examId": exam_data.examId},
-        {"$set": {"isCompleted": True, "completedAt": datetime.utcnow()}}
-    )
+    return results, correct_count
+
+@router.post("/submit", response_model=ExamSubmitResponse)
+@db_budget(6)
+async def submit_exam(
+    exam_data: ExamSubmit,
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Submit exam answers and calculate results"""
+    db = await get_database()
+    exam_sessions_repository = ExamSessionsRepository(db)
     
-    # Update user progress
-    await update_user_progress(current_user.id, session["examType"], session.get("topicId"), score)
+    # Causal session: the user's next history reads see these writes
+    async with causal_write_session(current_user.id) as db_session:
+        # Claim the open exam session and mark it completed in one round trip, so a
+        # concurrent resubmit of the same exam finds nothing to grade
+        session = await exam_sessions_repository.complete_open(exam_data.examId, current_user.id, db_session)
+        
+        if not session:
+            raise HTTPException(
+                status_code=404,
+                detail="Exam session not found or already completed"
+            )
+        
+        try:
+            # Check if exam time has expired
+            elapsed_time = datetime.utcnow() - session["startTime"]
+            if elapsed_time.total_seconds() > session["duration"]:
+                logger.warning(f"Exam {exam_data.examId} submitted after time limit")
+            
+            # Get grading fields of the questions used in exam, keyed by ID for preserving order
+            question_ids = session["questionIds"]
+            question_lookup = await QuestionsRepository(db).for_grading(question_ids)
+            ordered_questions = [question_lookup[str(qid)] for qid in question_ids if str(qid) in question_lookup]
+            
+            results, correct_count = grade_answers(ordered_questions, exam_data.answers)
+            
+            # Calculate score
+            total_questions = len(ordered_questions)
+            score = round((correct_count / total_questions) * 100) if total_questions > 0 else 0
+            
+            # Save exam result
+            exam_result = {
+                "userId": ObjectId(current_user.id),
+                "examType": session["examType"],
+                "topicId": session.get("topicId"),
+                "score": score,
+                "correctAnswers": correct_count,
+                "totalQuestions": total_questions,
+                "timeSpent": exam_data.timeSpent,
+                "answers": exam_data.answers,
+                "questionIds": question_ids,
+                "completedAt": datetime.utcnow(),
+                "createdAt": datetime.utcnow()
+            }
+            
+            await ExamResultsRepository(db).insert(exam_result, db_session)
+        except Exception:
+            # Nothing was saved: give the session back so the client can resubmit instead of getting a 404
+            try:
+                await exam_sessions_repository.reopen(exam_data.examId, current_user.id, db_session)
+            except Exception as e:
+                logger.error(f"Could not reopen exam session {exam_data.examId}: {e}")
+            raise
+        
+        # The result is saved, so failures past this point must not reopen the session
+        # (a resubmit would record the exam twice)
+        await update_user_progress(
+            current_user.id, session["examType"], session.get("topicId"), score, db_session
+        )
     
-    logger.info(f"Exam {exam_data.examId} submitted by {current_user.username} - Score: {score}%")
+    logger.info("Exam %s submitted by %s - Score: %d%%", exam_data.examId, current_user.username, score)
     
     return ExamSubmitResponse(
         score=score,
@@ -220,56 +215,33 @@ async def submit_exam(
     )
 
 @router.get("/history", response_model=ExamHistoryResponse)
+@db_budget(3)
 async def get_exam_history(
     current_user: UserResponse = Depends(get_current_user)
 ):
     """Get user's exam history"""
-    db = await get_database()
+    db = await get_read_database("exam_history")
     
-    # Get exam results for current user
-    results_cursor = db[EXAM_RESULTS_COLLECTION].find(
-        {"userId": ObjectId(current_user.id)}
-    ).sort("completedAt", -1).limit(50)
+    exam_results_repository = ExamResultsRepository(db)
     
-    results = await results_cursor.to_list(length=50)
+    async with causal_read_session(current_user.id) as db_session:
+        # Get exam results for current user
+        results = await exam_results_repository.history(current_user.id, 50, db_session)
+        total = await exam_results_repository.count_for_user(current_user.id, db_session)
     
     # Convert to response format
-    exam_results = [
-        ExamResultResponse(**serialize_doc(result))
-        for result in results
-    ]
-    
-    total = await db[EXAM_RESULTS_COLLECTION].count_documents(
-        {"userId": ObjectId(current_user.id)}
-    )
+    exam_results = [ExamResultResponse(**result) for result in results]
     
-    logger.info(f"Retrieved {len(exam_results)} exam results for user {current_user.username}")
+    logger.info("Retrieved %d exam results for user %s", len(exam_results), current_user.username)
     
     return ExamHistoryResponse(exams=exam_results, total=total)
 
-async def update_user_progress(user_id: str, exam_type: str, topic_id: int, score: int):
+async def update_user_progress(user_id: str, exam_type: str, topic_id: int, score: int, session=None):
     """Update user's progress based on exam results"""
     db = await get_database()
     
-    # Get current user data
-    user = await db[USERS_COLLECTION].find_one({"_id": ObjectId(user_id)})
-    if not user:
-        return
-    
-    progress = user.get("progress", {
-        "completedQuestions": 0,
-        "totalQuestions": 100,
-        "averageScore": 0.0,
-        "topicScores": {}
-    })
-    
     # Update topic score if it's a topic exam
-    if exam_type == "topic" and topic_id:
-        topic_key = str(topic_id)
-        current_topic_score = progress["topicScores"].get(topic_key, 0)
-        # Use the better score
-        new_topic_score = max(current_topic_score, score)
-        progress["topicScores"][topic_key] = new_topic_score
+    topic_key = str(topic_id) if exam_type == "topic" and topic_id else None
     
     # Update overall progress
     questions_added = {
@@ -278,26 +250,14 @@ async def update_user_progress(user_id: str, exam_type: str, topic_id: int, scor
         "topic": 10
     }.get(exam_type, 0)
     
-    progress["completedQuestions"] += questions_added
-    
     # Recalculate average score based on recent exam results (last 100 exams)
-    all_results = await db[EXAM_RESULTS_COLLECTION].find(
-        {"userId": ObjectId(user_id)}
-    ).sort("completedAt", -1).limit(100).to_list(length=100)
-    
-    if all_results:
-        total_score = sum(result["score"] for result in all_results)
-        progress["averageScore"] = round(total_score / len(all_results), 1)
+    recent_scores = await ExamResultsRepository(db).recent_scores(user_id, 100, session)
+    average_score = round(sum(recent_scores) / len(recent_scores), 1) if recent_scores else None
     
-    # Update user in database
-    await db[USERS_COLLECTION].update_one(
-        {"_id": ObjectId(user_id)},
-        {
-            "$set": {
-                "progress": progress,
-                "updatedAt": datetime.utcnow()
-            }
-        }
+    # Update user in database with $inc/$max rather than writing back a snapshot,
+    # so concurrent submissions don't overwrite each other
+    await UsersRepository(db).record_exam_progress(
+        user_id, questions_added, average_score, topic_key, score, session
     )
     
-    logger.info(f"Updated progress for user {user_id}")
\ No newline at end of file
+    logger.info("Updated progress for user %s", user_id)
@@ -5,7 +5,8 @@ import logging
 
 from models import QuestionResponse, QuestionsResponse, ExamType, UserResponse
 from auth import get_current_user
-from database import get_database, QUESTIONS_COLLECTION, serialize_doc, serialize_docs
+from database import get_read_database
+from repositories import QuestionsRepository, to_api
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -18,7 +19,7 @@ async def get_questions(
     current_user: UserResponse = Depends(get_current_user)
 ):
     """Get questions filtered by topic, difficulty, and limit"""
-    db = await get_database()
+    db = await get_read_database("questions")
     
     # Build filter query
     filter_query = {}
@@ -27,20 +28,18 @@ async def get_questions(
     if difficulty:
         filter_query["difficulty"] = difficulty
     
+    questions_repository = QuestionsRepository(db)
+    
     # Get questions
-    questions_cursor = db[QUESTIONS_COLLECTION].find(filter_query).limit(limit)
-    questions = await questions_cursor.to_list(length=limit)
+    questions = await questions_repository.find_public(filter_query, limit)
     
     # Get total count
-    total = await db[QUESTIONS_COLLECTION].count_documents(filter_query)
+    total = await questions_repository.count(filter_query)
     
     # Convert to response format
-    questions_response = [
-        QuestionResponse(**serialize_doc(q)) 
-        for q in questions
-    ]
+    questions_response = [QuestionResponse(**q) for q in questions]
     
-    logger.info(f"Retrieved {len(questions_response)} questions for user {current_user.username}")
+    logger.info("Retrieved %d questions for user %s", len(questions_response), current_user.username)
     return QuestionsResponse(questions=questions_response, total=total)
 
 @router.get("/random", response_model=QuestionsResponse)
@@ -50,7 +49,7 @@ async def get_random_questions(
     current_user: UserResponse = Depends(get_current_user)
 ):
     """Get random questions for exam based on type and topic"""
-    db = await get_database()
+    db = await get_read_database("questions")
     
     # Determine number of questions based on exam type
     question_count = {
@@ -72,18 +71,8 @@ async def get_random_questions(
         # For practice, get random questions from multiple topics
         pass
     
-    pipeline = []
-    if match_stage:
-        pipeline.append({"$match": match_stage})
-    
-    pipeline.extend([
-        {"$sample": {"size": limit * 2}},  # Get more than needed for better randomization
-        {"$limit": limit}
-    ])
-    
-    # Execute aggregation
-    questions_cursor = db[QUESTIONS_COLLECTION].aggregate(pipeline)
-    questions = await questions_cursor.to_list(length=limit)
+    # Oversampled $sample for better randomization
+    questions = await QuestionsRepository(db).sample(match_stage, limit)
     
     if len(questions) < limit:
         logger.warning(f"Only found {len(questions)} questions, requested {limit}")
@@ -95,15 +84,12 @@ async def get_random_questions(
             )
     
     # Convert to response format
-    questions_response = [
-        QuestionResponse(**serialize_doc(q)) 
-        for q in questions
-    ]
+    questions_response = [QuestionResponse(**to_api(q)) for q in questions]
     
     # Shuffle the questions one more time
     random.shuffle(questions_response)
     
-    logger.info(f"Retrieved {len(questions_response)} random questions for {examType} exam")
+    logger.info("Retrieved %d random questions for %s exam", len(questions_response), examType)
     return QuestionsResponse(questions=questions_response, total=len(questions_response))
 
 @router.get("/topics/{topicId}", response_model=QuestionsResponse)
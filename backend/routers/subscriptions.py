@@ -1,57 +1,62 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from typing import List, Optional
 from datetime import datetime, timedelta
+import math
 import os
-import paypalrestsdk as paypal
 import logging
 
 from models import (
     Subscription, SubscriptionCreate, SubscriptionResponse, 
     Payment, PaymentCreate, PaymentStatus, SubscriptionStatus,
-    MessageResponse
+    PaymentResponse, PaymentSummary, MessageResponse
 )
 from auth import get_current_user, get_password_hash
-from database import (
-    get_database, USERS_COLLECTION, SUBSCRIPTIONS_COLLECTION, 
-    PAYMENTS_COLLECTION, serialize_doc
-)
+from database import get_database, transaction
+from db_monitoring import db_budget
+from repositories import SubscriptionsRepository, PaymentsRepository, to_api
+from subscription_state import subscription_response
+from migrations import SUBSCRIPTION_SCHEMA_VERSION
+from entitlement import entitlement_from_subscription, set_entitlements
+from paypal_gateway import get_paypal_gateway, PayPalError, PayPalTimeout
+from resilience import ProviderUnavailable
+from payment_reconciliation import complete_payments, store_webhook_event
+from payment_history import encode_payment_cursor, get_payment_summary
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Configure PayPal
-paypal.configure({
-    "mode": os.getenv("PAYPAL_MODE", "sandbox"),  # sandbox or live
-    "client_id": os.getenv("PAYPAL_CLIENT_ID"),
-    "client_secret": os.getenv("PAYPAL_CLIENT_SECRET")
-})
+async def call_paypal(action: str, call):
+    """Await a gateway call, translating provider failures into HTTP errors"""
+    try:
+        return await call()
+    except ProviderUnavailable as e:
+        # Breaker open or bulkhead full: fail fast so payment traffic cannot pile up
+        logger.warning(f"PayPal {action} rejected: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Payment provider is temporarily unavailable, please retry shortly",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
+    except PayPalTimeout as e:
+        logger.error(f"PayPal payment {action} timed out: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="PayPal did not respond in time"
+        )
+    except PayPalError as e:
+        logger.error(f"PayPal payment {action} failed: {e} {e.details}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to {action} PayPal payment"
+        )
 
 async def get_user_subscription(user_id: str, db):
     """Get user's current subscription"""
-    subscription = await db[SUBSCRIPTIONS_COLLECTION].find_one({"userId": user_id})
+    subscription = await SubscriptionsRepository(db).get_for_user(user_id)
     if not subscription:
         return None
     
-    # Calculate days remaining and active status
-    now = datetime.utcnow()
-    subscription_data = serialize_doc(subscription)
-    
-    if subscription_data["status"] == SubscriptionStatus.trial and subscription_data.get("trialEndDate"):
-        end_date = subscription_data["trialEndDate"]
-        days_remaining = (end_date - now).days if end_date > now else 0
-        is_active = days_remaining > 0
-    elif subscription_data["status"] == SubscriptionStatus.active and subscription_data.get("subscriptionEndDate"):
-        end_date = subscription_data["subscriptionEndDate"]
-        days_remaining = (end_date - now).days if end_date > now else 0
-        is_active = days_remaining > 0
-    else:
-        days_remaining = 0
-        is_active = False
-    
-    subscription_data["daysRemaining"] = days_remaining
-    subscription_data["isActive"] = is_active
-    
-    return SubscriptionResponse(**subscription_data)
+    return subscription_response(subscription)
 
 @router.post("/subscribe", response_model=SubscriptionResponse)
 async def create_subscription(
@@ -60,10 +65,10 @@ async def create_subscription(
 ):
     """Create a new subscription with 5-day trial"""
     db = await get_database()
+    subscriptions = SubscriptionsRepository(db)
     
     # Check if user already has a subscription
-    existing_subscription = await db[SUBSCRIPTIONS_COLLECTION].find_one({"userId": current_user.id})
-    if existing_subscription:
+    if await subscriptions.exists_for_user(current_user.id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User already has a subscription"
@@ -81,45 +86,33 @@ async def create_subscription(
         "trialEndDate": trial_end,
         "subscriptionStartDate": None,
         "subscriptionEndDate": None,
+        "endDate": trial_end,
         "paypalSubscriptionId": None,
         "createdAt": now,
-        "updatedAt": now
+        "updatedAt": now,
+        "schemaVersion": SUBSCRIPTION_SCHEMA_VERSION
     }
     
-    result = await db[SUBSCRIPTIONS_COLLECTION].insert_one(new_subscription)
-    new_subscription["id"] = str(result.inserted_id)
+    async with transaction() as session:
+        await subscriptions.insert(new_subscription, session)
+        await set_entitlements(
+            db, {current_user.id: entitlement_from_subscription(new_subscription)}, session=session
+        )
     
     # Calculate response data
     new_subscription["daysRemaining"] = 5
     new_subscription["isActive"] = True
     
     logger.info(f"Created trial subscription for user: {current_user.username}")
-    return SubscriptionResponse(**serialize_doc(new_subscription))
+    return SubscriptionResponse(**to_api(new_subscription))
 
 @router.get("/status", response_model=Optional[SubscriptionResponse])
+@db_budget(2)
 async def get_subscription_status(current_user = Depends(get_current_user)):
     """Get current user's subscription status"""
     db = await get_database()
-    subscription = await get_user_subscription(current_user.id, db)
-    
-    if not subscription:
-        return None
-    
-    # Auto-update expired subscriptions
-    if subscription.daysRemaining <= 0 and subscription.status in [SubscriptionStatus.trial, SubscriptionStatus.active]:
-        await db[SUBSCRIPTIONS_COLLECTION].update_one(
-            {"userId": current_user.id},
-            {
-                "$set": {
-                    "status": SubscriptionStatus.expired,
-                    "updatedAt": datetime.utcnow()
-                }
-            }
-        )
-        subscription.status = SubscriptionStatus.expired
-        subscription.isActive = False
-    
-    return subscription
+    # Lapsed subscriptions are reported as expired; the expiry sweeper persists it
+    return await get_user_subscription(current_user.id, db)
 
 @router.post("/create-payment", response_model=dict)
 async def create_paypal_payment(current_user = Depends(get_current_user)):
@@ -135,7 +128,7 @@ async def create_paypal_payment(current_user = Depends(get_current_user)):
         )
     
     # Create PayPal payment
-    payment = paypal.Payment({
+    payment_request = {
         "intent": "sale",
         "payer": {"payment_method": "paypal"},
         "redirect_urls": {
@@ -158,35 +151,38 @@ async def create_paypal_payment(current_user = Depends(get_current_user)):
             },
             "description": "Monthly subscription to Moose Arborist Study Platform"
         }]
-    })
+    }
     
-    if payment.create():
-        # Store payment record
-        payment_record = {
-            "userId": current_user.id,
-            "subscriptionId": subscription.id,
-            "paypalOrderId": payment.id,
-            "amount": 10.0,
-            "currency": "USD",
-            "status": PaymentStatus.pending,
-            "createdAt": datetime.utcnow(),
-            "updatedAt": datetime.utcnow()
-        }
-        await db[PAYMENTS_COLLECTION].insert_one(payment_record)
-        
-        # Get approval URL
-        for link in payment.links:
-            if link.rel == "approval_url":
-                return {
-                    "paymentId": payment.id,
-                    "approvalUrl": str(link.href)
-                }
-    else:
-        logger.error(f"PayPal payment creation failed: {payment.error}")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Failed to create PayPal payment"
-        )
+    payment = await call_paypal(
+        "create", lambda: get_paypal_gateway().create_payment(payment_request)
+    )
+    
+    # Store payment record
+    payment_record = {
+        "userId": current_user.id,
+        "subscriptionId": subscription.id,
+        "paypalOrderId": payment["id"],
+        "amount": 10.0,
+        "currency": "USD",
+        "status": PaymentStatus.pending,
+        "createdAt": datetime.utcnow(),
+        "updatedAt": datetime.utcnow()
+    }
+    await PaymentsRepository(db).insert(payment_record)
+    
+    # Get approval URL
+    for link in payment.get("links", []):
+        if link.get("rel") == "approval_url":
+            return {
+                "paymentId": payment["id"],
+                "approvalUrl": str(link["href"])
+            }
+    
+    logger.error(f"PayPal payment {payment['id']} has no approval URL")
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Failed to create PayPal payment"
+    )
 
 @router.post("/execute-payment", response_model=MessageResponse)
 async def execute_paypal_payment(
@@ -197,78 +193,94 @@ async def execute_paypal_payment(
     """Execute PayPal payment after approval"""
     db = await get_database()
     
-    # Get payment from PayPal
-    payment = paypal.Payment.find(payment_id)
+    # Execute the approved payment with PayPal
+    payment = await call_paypal(
+        "execute", lambda: get_paypal_gateway().execute_payment(payment_id, payer_id)
+    )
     
-    if payment.execute({"payer_id": payer_id}):
-        # Update payment record
-        await db[PAYMENTS_COLLECTION].update_one(
-            {"paypalOrderId": payment_id},
-            {
-                "$set": {
-                    "paypalPaymentId": payment.id,
-                    "status": PaymentStatus.completed,
-                    "updatedAt": datetime.utcnow()
-                }
-            }
-        )
-        
-        # Update subscription to active
-        now = datetime.utcnow()
-        next_month = now + timedelta(days=30)
-        
-        await db[SUBSCRIPTIONS_COLLECTION].update_one(
-            {"userId": current_user.id},
-            {
-                "$set": {
-                    "status": SubscriptionStatus.active,
-                    "subscriptionStartDate": now,
-                    "subscriptionEndDate": next_month,
-                    "updatedAt": now
-                }
-            }
-        )
-        
-        logger.info(f"Payment completed for user: {current_user.username}")
-        return MessageResponse(message="Payment completed successfully")
-    else:
-        logger.error(f"PayPal payment execution failed: {payment.error}")
+    # Mark the payment completed and activate the subscription (no-op if a
+    # webhook already did it)
+    await complete_payments(db, {payment_id: payment["id"]})
+    
+    logger.info(f"Payment completed for user: {current_user.username}")
+    return MessageResponse(message="Payment completed successfully")
+
+@router.post("/webhooks/paypal", response_model=MessageResponse)
+async def paypal_webhook(request: Request):
+    """Receive PayPal webhook events; they are verified, stored once and applied in the background"""
+    webhook_id = os.getenv("PAYPAL_WEBHOOK_ID")
+    if not webhook_id:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Failed to execute PayPal payment"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="PayPal webhooks are not configured"
         )
+    
+    event = await request.json()
+    if not isinstance(event, dict) or not event.get("id"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid webhook event")
+    
+    headers = {key.lower(): value for key, value in request.headers.items()}
+    verified = await call_paypal(
+        "verify", lambda: get_paypal_gateway().verify_webhook_signature(webhook_id, headers, event)
+    )
+    if not verified:
+        logger.warning(f"Rejected PayPal webhook {event['id']} with invalid signature")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid webhook signature")
+    
+    db = await get_database()
+    if not await store_webhook_event(db, event):
+        return MessageResponse(message="Event already received")
+    
+    logger.info(f"Stored PayPal webhook {event['id']} ({event.get('event_type')})")
+    return MessageResponse(message="Event received")
 
 @router.post("/cancel", response_model=MessageResponse)
 async def cancel_subscription(current_user = Depends(get_current_user)):
     """Cancel user's subscription"""
     db = await get_database()
     
-    # Update subscription status
-    result = await db[SUBSCRIPTIONS_COLLECTION].update_one(
-        {"userId": current_user.id},
-        {
-            "$set": {
-                "status": SubscriptionStatus.cancelled,
-                "updatedAt": datetime.utcnow()
-            }
-        }
-    )
-    
-    if result.matched_count == 0:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="No subscription found for user"
-        )
+    # Update subscription status and the user's entitlement together
+    now = datetime.utcnow()
+    async with transaction() as session:
+        cancelled = await SubscriptionsRepository(db).cancel(current_user.id, now, session)
+        
+        if not cancelled:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No subscription found for user"
+            )
+        
+        await set_entitlements(db, {
+            current_user.id: {"status": SubscriptionStatus.cancelled.value, "expiresAt": None}
+        }, session=session)
     
     logger.info(f"Subscription cancelled for user: {current_user.username}")
     return MessageResponse(message="Subscription cancelled successfully")
 
-@router.get("/payments", response_model=List[dict])
-async def get_payment_history(current_user = Depends(get_current_user)):
-    """Get user's payment history"""
+@router.get("/payments", response_model=List[PaymentResponse])
+@db_budget(2)
+async def get_payment_history(
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    before: str = None,
+    current_user = Depends(get_current_user)
+):
+    """Get a page of the user's payments, newest first; the next page cursor is in X-Next-Cursor"""
     db = await get_database()
     
-    payments_cursor = db[PAYMENTS_COLLECTION].find({"userId": current_user.id})
-    payments = await payments_cursor.to_list(length=100)
+    try:
+        payments = await PaymentsRepository(db).history_page(current_user.id, before, limit)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    
+    if len(payments) == limit:
+        response.headers["X-Next-Cursor"] = encode_payment_cursor(payments[-1])
     
-    return [serialize_doc(payment) for payment in payments]
\ No newline at end of file
+    return [PaymentResponse(**payment) for payment in payments]
+
+@router.get("/payments/summary", response_model=PaymentSummary)
+@db_budget(2)
+async def get_payment_summary_endpoint(current_user = Depends(get_current_user)):
+    """Get the user's total paid and last payment"""
+    db = await get_database()
+    return await get_payment_summary(db, current_user.id)
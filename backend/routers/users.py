@@ -1,35 +1,20 @@
 from fastapi import APIRouter, Depends
-from bson import ObjectId
 import logging
 
 from models import UserResponse, UserProgress
 from auth import get_current_user
-from database import get_database, USERS_COLLECTION
+from db_monitoring import db_budget
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.get("/progress", response_model=UserProgress)
+@db_budget(1)
 async def get_user_progress(
     current_user: UserResponse = Depends(get_current_user)
 ):
     """Get current user's progress"""
-    db = await get_database()
+    # get_current_user just read the user from the primary, so its progress is already fresh
+    logger.info("Retrieved progress for user %s", current_user.username)
     
-    # Get fresh user data from database
-    user = await db[USERS_COLLECTION].find_one({"_id": ObjectId(current_user.id)})
-    
-    if not user:
-        # Return current user progress if not found in DB
-        return current_user.progress
-    
-    progress_data = user.get("progress", {
-        "completedQuestions": 0,
-        "totalQuestions": 100,
-        "averageScore": 0.0,
-        "topicScores": {}
-    })
-    
-    logger.info(f"Retrieved progress for user {current_user.username}")
-    
-    return UserProgress(**progress_data)
\ No newline at end of file
+    return current_user.progress
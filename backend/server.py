@@ -1,4 +1,5 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
@@ -6,20 +7,34 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 
-from database import connect_to_mongo, close_mongo_connection, create_indexes
-from routers import auth, questions, exams, users, admin, subscriptions
-
-# Load environment variables
+# Load environment variables before the project modules read their settings at import
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from log_pipeline import configure_logging
+
+from database import connect_to_mongo, close_mongo_connection
+from repositories import create_indexes
+from migrations import run_migrations
+from cleanup import resume_cleanup_jobs
+from auth import shutdown_password_executor
+from paypal_gateway import get_paypal_gateway
+from payment_reconciliation import start_payment_workers, stop_payment_workers
+from subscription_expiry import start_expiry_sweeper, stop_expiry_sweeper
+from revenue_rollups import start_rollup_job, stop_rollup_job
+from db_monitoring import RequestContextMiddleware
+from loop_watchdog import start_loop_watchdog, stop_loop_watchdog
+from tracing import TracingMiddleware, start_tracing, stop_tracing
+from metrics import MetricsMiddleware, render_metrics, start_loop_lag_monitor, stop_loop_lag_monitor
+from routers import auth, questions, exams, users, admin, subscriptions
+
+# Configure logging (queued; written by a background thread)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# When set, scrapers must send "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
 # Lifespan event handler
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -27,13 +42,29 @@ async def lifespan(app: FastAPI):
     logger.info("Starting up arborist platform backend...")
     await connect_to_mongo()
     await create_indexes()
+    await run_migrations()
+    await resume_cleanup_jobs()
+    start_payment_workers()
+    start_expiry_sweeper()
+    start_rollup_job()
+    start_loop_lag_monitor()
+    start_loop_watchdog()
+    start_tracing()
     logger.info("Backend startup completed")
     
     yield
     
     # Shutdown
     logger.info("Shutting down backend...")
+    await stop_loop_watchdog()
+    await stop_loop_lag_monitor()
+    await stop_payment_workers()
+    await stop_expiry_sweeper()
+    await stop_rollup_job()
+    shutdown_password_executor()
+    await get_paypal_gateway().close()
     await close_mongo_connection()
+    stop_tracing()
     logger.info("Backend shutdown completed")
 
 # Create FastAPI app
@@ -51,8 +82,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "Server-Timing", "X-Request-ID"],
 )
 
+# Tags database commands with the route that issued them
+app.add_middleware(RequestContextMiddleware)
+
+# Request latency histograms for /api/metrics
+app.add_middleware(MetricsMiddleware)
+
+# Request spans (TRACE_EXPORT_FILE / TRACE_OTLP_ENDPOINT); outermost so every other span nests in it
+app.add_middleware(TracingMiddleware)
+
 # Include routers with /api prefix
 app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
 app.include_router(questions.router, prefix="/api/questions", tags=["questions"])
@@ -67,6 +108,14 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "arborist-backend"}
 
+# Prometheus metrics endpoint
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics(authorization: str = Header(None)):
+    """Prometheus text-format metrics for this worker"""
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # Root endpoint
 @app.get("/api")
 async def root():
@@ -0,0 +1,53 @@
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+import os
+import logging
+
+from database import get_database, transaction, SUBSCRIPTIONS_COLLECTION
+from models import SubscriptionStatus
+from entitlement import expire_entitlements
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_SWEEP_INTERVAL_SECONDS = float(os.getenv("SUBSCRIPTION_EXPIRY_SWEEP_SECONDS", "300"))
+
+_tasks: List[asyncio.Task] = []
+
+async def expire_lapsed_subscriptions(db, now: Optional[datetime] = None) -> int:
+    """Mark every trial/active subscription whose endDate has passed as expired, in one write"""
+    now = now or datetime.utcnow()
+    async with transaction() as session:
+        result = await db[SUBSCRIPTIONS_COLLECTION].update_many(
+            {
+                "status": {"$in": [SubscriptionStatus.trial.value, SubscriptionStatus.active.value]},
+                "endDate": {"$lte": now}
+            },
+            {"$set": {"status": SubscriptionStatus.expired.value, "updatedAt": now}},
+            session=session
+        )
+        await expire_entitlements(db, now, session=session)
+    if result.modified_count:
+        logger.info(f"Expired {result.modified_count} lapsed subscriptions")
+    return result.modified_count
+
+async def _expiry_loop():
+    while True:
+        try:
+            db = await get_database()
+            await expire_lapsed_subscriptions(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Subscription expiry sweep error: {e}")
+        await asyncio.sleep(EXPIRY_SWEEP_INTERVAL_SECONDS)
+
+def start_expiry_sweeper():
+    """Start the periodic subscription expiry sweep"""
+    _tasks.append(asyncio.create_task(_expiry_loop()))
+
+async def stop_expiry_sweeper():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
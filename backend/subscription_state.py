@@ -0,0 +1,38 @@
+import math
+from datetime import datetime
+from typing import Dict, Optional
+
+from models import SubscriptionResponse, SubscriptionStatus
+
+def subscription_end_date(subscription: Dict) -> Optional[datetime]:
+    """End of the period that currently grants access, if any"""
+    if subscription.get("status") == SubscriptionStatus.trial:
+        return subscription.get("trialEndDate")
+    if subscription.get("status") == SubscriptionStatus.active:
+        return subscription.get("subscriptionEndDate")
+    return None
+
+def subscription_response(subscription: Dict, now: Optional[datetime] = None) -> SubscriptionResponse:
+    """Build a SubscriptionResponse (with daysRemaining/isActive) from a serialized document.
+
+    Pure: a lapsed trial/active subscription is reported as expired here and
+    persisted as expired by the expiry sweeper, never by the read path.
+    """
+    now = now or datetime.utcnow()
+    subscription_data = dict(subscription)
+
+    end_date = subscription_end_date(subscription_data)
+    if end_date:
+        # Same test as is_entitled and the expiry sweeper; a partial last day counts as a day
+        is_active = end_date > now
+        days_remaining = math.ceil((end_date - now).total_seconds() / 86400) if is_active else 0
+        if not is_active:
+            subscription_data["status"] = SubscriptionStatus.expired
+    else:
+        days_remaining = 0
+        is_active = False
+
+    subscription_data["daysRemaining"] = days_remaining
+    subscription_data["isActive"] = is_active
+
+    return SubscriptionResponse(**subscription_data)
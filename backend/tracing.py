@@ -0,0 +1,316 @@
+"""
+Lightweight request tracing with OTLP/JSON export.
+
+TracingMiddleware opens a server span per request, continuing the caller's
+trace when a W3C ``traceparent`` header is present. Code running for the
+request opens child spans with ``span()``; MongoDB commands get one from
+TracingCommandListener. Outside a sampled request ``span()`` does nothing, so
+background workers and unsampled requests pay almost nothing.
+
+Finished spans are batched by a background thread and written as OTLP/JSON
+ExportTraceServiceRequest objects:
+
+    TRACE_EXPORT_FILE=traces.jsonl     one request per line (the OpenTelemetry
+                                       collector's otlpjsonfile receiver format)
+    TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces
+                                       OTLP/HTTP JSON, e.g. fake_collector.py
+
+Tracing is off unless one of them is set.
+"""
+import json
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+import httpx
+from pymongo import monitoring
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT")
+TRACING_ENABLED = bool(TRACE_EXPORT_FILE or TRACE_OTLP_ENDPOINT)
+# Share of requests traced when the caller did not decide
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "arborist-backend")
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+TRACE_BATCH_SIZE = 512
+TRACE_FLUSH_SECONDS = 2.0
+
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+STATUS_ERROR = 2
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: str = "internal",
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = dict(attributes) if attributes else {}
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        exporter.export(self)
+
+class _NoopSpan:
+    """Stands in for a span when nothing is being traced"""
+
+    def set(self, key: str, value: Any):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+@contextmanager
+def span(name: str, kind: str = "internal", attributes: Optional[Dict[str, Any]] = None):
+    """Child span of the current one; a no-op outside a traced request"""
+    parent = current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    child = Span(name, parent.trace_id, parent.span_id, kind, attributes)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current_span.reset(token)
+        child.end()
+
+# W3C trace context
+
+def parse_traceparent(value: str):
+    """(trace_id, parent span id, sampled) from a traceparent header, or None if malformed"""
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        sampled = bool(int(parts[3][:2], 16) & 1)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], sampled
+
+class TracingMiddleware:
+    """Open a server span per request, continuing the caller's trace if it sent one"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED:
+            return await self.app(scope, receive, send)
+
+        incoming = None
+        for name, value in scope.get("headers", []):
+            if name == b"traceparent":
+                incoming = parse_traceparent(value.decode("latin-1"))
+                break
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id, sampled = secrets.token_hex(16), None, random.random() < TRACE_SAMPLE_RATIO
+        if not sampled:
+            return await self.app(scope, receive, send)
+
+        server_span = Span(f"{scope['method']} {scope['path']}", trace_id, parent_id, "server", {
+            "http.request.method": scope["method"],
+            "url.path": scope["path"]
+        })
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                server_span.set("http.response.status_code", message["status"])
+                if message["status"] >= 500:
+                    server_span.error = f"HTTP {message['status']}"
+            await send(message)
+
+        token = current_span.set(server_span)
+        try:
+            await self.app(scope, receive, send_with_status)
+        except BaseException as e:
+            server_span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            current_span.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                server_span.name = f"{scope['method']} {route}"
+                server_span.set("http.route", route)
+            server_span.end()
+
+class TracingCommandListener(monitoring.CommandListener):
+    """A client span per MongoDB command issued inside a traced request.
+
+    PyMongo publishes the events on the thread running the command, which
+    Motor runs with a copy of the request's context.
+    """
+
+    def __init__(self):
+        self._pending: Dict[tuple, Span] = {}
+
+    def started(self, event):
+        parent = current_span.get()
+        if parent is None:
+            return
+        collection = event.command.get(event.command_name)
+        self._pending[(event.connection_id, event.request_id)] = Span(
+            f"mongodb {event.command_name}", parent.trace_id, parent.span_id, "client", {
+                "db.system": "mongodb",
+                "db.name": event.database_name,
+                "db.operation": event.command_name,
+                "db.mongodb.collection": collection if isinstance(collection, str) else ""
+            }
+        )
+
+    def succeeded(self, event):
+        command_span = self._pending.pop((event.connection_id, event.request_id), None)
+        if command_span is not None:
+            command_span.end()
+
+    def failed(self, event):
+        command_span = self._pending.pop((event.connection_id, event.request_id), None)
+        if command_span is not None:
+            command_span.error = str(event.failure)
+            command_span.end()
+
+command_tracer = TracingCommandListener()
+
+# Export
+
+def _attribute_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _otlp_span(item: Span) -> Dict:
+    encoded = {
+        "traceId": item.trace_id,
+        "spanId": item.span_id,
+        "name": item.name,
+        "kind": SPAN_KINDS.get(item.kind, 1),
+        "startTimeUnixNano": str(item.start_ns),
+        "endTimeUnixNano": str(item.end_ns),
+        "attributes": [{"key": key, "value": _attribute_value(value)} for key, value in item.attributes.items()]
+    }
+    if item.parent_id:
+        encoded["parentSpanId"] = item.parent_id
+    if item.error:
+        encoded["status"] = {"code": STATUS_ERROR, "message": item.error}
+    return encoded
+
+def otlp_request(spans: List[Span]) -> Dict:
+    return {"resourceSpans": [{
+        "resource": {"attributes": [
+            {"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}},
+            {"key": "process.pid", "value": {"intValue": str(os.getpid())}}
+        ]},
+        "scopeSpans": [{"scope": {"name": "arborist.tracing"}, "spans": [_otlp_span(item) for item in spans]}]
+    }]}
+
+class SpanExporter:
+    """Batches finished spans on a background thread; drops spans rather than block when full"""
+
+    def __init__(self, export_file: Optional[str], endpoint: Optional[str]):
+        self.export_file = export_file
+        self.endpoint = endpoint
+        self._queue: queue.Queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self.exported = 0
+        self.dropped = 0
+        self.failed_batches = 0
+
+    def export(self, item: Span):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+            logger.info(f"Tracing enabled, exporting to {self.endpoint or self.export_file}")
+
+    def stop(self):
+        """Flush what is queued and stop the export thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        client = httpx.Client(timeout=2.0) if self.endpoint else None
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + TRACE_FLUSH_SECONDS
+            while len(batch) < TRACE_BATCH_SIZE:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                self._write(client, batch)
+        if client is not None:
+            client.close()
+
+    def _write(self, client: Optional[httpx.Client], batch: List[Span]):
+        payload = otlp_request(batch)
+        try:
+            if self.export_file:
+                with open(self.export_file, "a") as f:
+                    f.write(json.dumps(payload) + "\n")
+            if client is not None:
+                client.post(self.endpoint, json=payload).raise_for_status()
+            self.exported += len(batch)
+        except Exception as e:
+            self.failed_batches += 1
+            logger.warning(f"Could not export {len(batch)} spans: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": TRACING_ENABLED,
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "failedBatches": self.failed_batches
+        }
+
+exporter = SpanExporter(TRACE_EXPORT_FILE, TRACE_OTLP_ENDPOINT)
+
+def start_tracing():
+    if TRACING_ENABLED:
+        exporter.start()
+
+def stop_tracing():
+    exporter.stop()
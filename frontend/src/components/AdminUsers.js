@@ -47,10 +47,17 @@ const AdminUsers = ({ adminPassword, onBack }) => {
     try {
       setLoading(true);
       setError('');
-      const response = await axios.get(`${BACKEND_URL}/api/admin/users`, {
-        params: { admin_password: adminPassword }
-      });
-      setUsers(response.data);
+      // The endpoint is paginated; follow X-Next-Cursor until every user is loaded
+      let allUsers = [];
+      let after = null;
+      do {
+        const response = await axios.get(`${BACKEND_URL}/api/admin/users`, {
+          params: { admin_password: adminPassword, limit: 1000, ...(after && { after }) }
+        });
+        allUsers = allUsers.concat(response.data);
+        setUsers(allUsers);
+        after = response.headers['x-next-cursor'];
+      } while (after);
     } catch (error) {
       console.error('Error fetching users:', error);
       setError('Error al cargar los usuarios');
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Subscription Checkout Load Test
+Runs the full register -> subscribe -> create-payment -> approve -> execute-payment
+flow for many concurrent users against a backend pointed at the local fake PayPal
+server (backend/fake_paypal.py, PAYPAL_API_BASE=http://localhost:8099)
+"""
+
+import requests
+import statistics
+import sys
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+
+# Configuration
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8001/api")
+USERS = int(os.getenv("LOAD_TEST_USERS", "50"))
+CONCURRENCY = int(os.getenv("LOAD_TEST_CONCURRENCY", "10"))
+
+STEPS = ["register", "login", "subscribe", "create_payment", "approve", "execute_payment"]
+
+def run_checkout_flow(index):
+    """Run one user's checkout flow, returning per-step timings or the failing step"""
+    session = requests.Session()
+    suffix = f"{index}_{uuid.uuid4().hex[:8]}"
+    user = {
+        "username": f"load_{suffix}",
+        "email": f"load_{suffix}@example.com",
+        "password": "LoadTest123!",
+        "name": f"Load Test User {index}",
+        "language": "en"
+    }
+    timings = {}
+
+    def timed(step, func):
+        start = time.perf_counter()
+        response = func()
+        timings[step] = time.perf_counter() - start
+        if response.status_code not in (200, 302, 303, 307):
+            raise RuntimeError(f"{step} failed: {response.status_code} {response.text[:200]}")
+        return response
+
+    try:
+        timed("register", lambda: session.post(f"{BACKEND_URL}/auth/register", json=user))
+        token = timed("login", lambda: session.post(
+            f"{BACKEND_URL}/auth/login",
+            json={"username": user["username"], "password": user["password"]}
+        )).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        timed("subscribe", lambda: session.post(
+            f"{BACKEND_URL}/subscriptions/subscribe",
+            json={"planId": "monthly_10", "startTrial": True},
+            headers=headers
+        ))
+        payment = timed("create_payment", lambda: session.post(
+            f"{BACKEND_URL}/subscriptions/create-payment", headers=headers
+        )).json()
+
+        # The fake approval page redirects to the return URL with PayerID
+        approval = timed("approve", lambda: session.get(payment["approvalUrl"], allow_redirects=False))
+        query = parse_qs(urlparse(approval.headers["location"]).query)
+
+        timed("execute_payment", lambda: session.post(
+            f"{BACKEND_URL}/subscriptions/execute-payment",
+            params={"payment_id": query["paymentId"][0], "payer_id": query["PayerID"][0]},
+            headers=headers
+        ))
+        return {"ok": True, "timings": timings}
+
+    except Exception as e:
+        return {"ok": False, "timings": timings, "error": str(e)}
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def main():
+    print(f"🚀 Running {USERS} checkout flows with concurrency {CONCURRENCY} against {BACKEND_URL}")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        results = list(executor.map(run_checkout_flow, range(USERS)))
+    elapsed = time.perf_counter() - start
+
+    succeeded = [r for r in results if r["ok"]]
+    failed = [r for r in results if not r["ok"]]
+
+    print(f"\n✅ {len(succeeded)} succeeded, ❌ {len(failed)} failed in {elapsed:.1f}s "
+          f"({len(results) / elapsed:.1f} flows/s)")
+    print(f"\n{'step':<18}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for step in STEPS:
+        values = [r["timings"][step] * 1000 for r in results if step in r["timings"]]
+        if not values:
+            continue
+        print(f"{step:<18}{len(values):>7}{statistics.median(values):>10.1f}"
+              f"{percentile(values, 95):>10.1f}{percentile(values, 99):>10.1f}{max(values):>10.1f}")
+
+    for result in failed[:10]:
+        print(f"   Error: {result['error']}")
+
+    return 0 if not failed else 1
+
+if __name__ == "__main__":
+    sys.exit(main())